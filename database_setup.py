@@ -13,9 +13,113 @@ database file (`analysis_database.db`) in the same directory.
 
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
 
 DATABASE_FILE = "analysis_database.db"
 
+# --- Schema ---
+SCHEMA_SQL = """
+-- 'stocks' (SIMPLIFIED): the static historical notes and the AI's dynamic "living document" JSON
+CREATE TABLE IF NOT EXISTS stocks (
+    ticker TEXT PRIMARY KEY,
+    historical_level_notes TEXT,      -- Your critical, static historical context
+    company_overview_card_json TEXT,  -- The AI's full 6-part JSON output (Living Document)
+    last_updated TEXT                 -- Last date the AI updated the JSON
+);
+
+-- 'data_archive' (Unchanged): the raw 5-minute summary text and parsed data for historical reference
+CREATE TABLE IF NOT EXISTS data_archive (
+    archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT,
+    date TEXT,
+    raw_text_summary TEXT,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    poc REAL,
+    vah REAL,
+    val REAL,
+    vwap REAL,
+    orl REAL,
+    orh REAL,
+    UNIQUE(ticker, date) -- Prevent duplicate entries for the same day
+);
+
+-- UNIQUE(ticker, date) already gives a (ticker, date) index for per-ticker lookups.
+-- The data manager filters by `date BETWEEN ? AND ?` first, which that index can't
+-- serve, so add a date-leading index (it also covers DISTINCT ticker over a range).
+CREATE INDEX IF NOT EXISTS idx_archive_date_ticker ON data_archive(date, ticker);
+
+-- 'market_context': the single, global "Economy Card"
+CREATE TABLE IF NOT EXISTS market_context (
+    context_id INTEGER PRIMARY KEY CHECK (context_id = 1), -- Ensures only one row
+    economy_card_json TEXT,
+    last_updated TEXT
+);
+
+-- Initialize the single row for the economy card
+INSERT OR IGNORE INTO market_context (context_id, economy_card_json, last_updated)
+VALUES (1, NULL, NULL);
+"""
+
+def configure_connection(conn, read_only=False):
+    """
+    Applies the app's SQLite PRAGMAs to a new connection and returns it.
+
+    WAL lets readers run alongside a writer, and synchronous=NORMAL drops the fsync
+    on every commit (safe under WAL). journal_mode is stored in the database file,
+    so read-only connections skip it; the other settings are per-connection.
+    """
+    if not read_only:
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-20000")      # ~20 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")    # 256 MB memory-mapped reads
+    return conn
+
+def make_writer():
+    """
+    Opens the app's writer connection. It may be shared across threads, so callers
+    must serialize their use of it (the pipeline page guards it with a lock).
+    """
+    conn = configure_connection(sqlite3.connect(DATABASE_FILE, check_same_thread=False))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+class ReadPool:
+    """
+    Bounded pool of read-only (`mode=ro`) connections. Under WAL these read a consistent
+    snapshot without blocking, or being blocked by, the writer.
+
+    Connections are opened lazily up to `size` and reused; `acquire()` waits when all
+    of them are in use.
+    """
+    def __init__(self, size=None):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size or os.cpu_count() or 4)
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{DATABASE_FILE}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return configure_connection(conn, read_only=True)
+
+    @contextmanager
+    def acquire(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+
 def create_database():
     """Creates the SQLite database and the necessary tables if they don't exist."""
     
@@ -27,68 +131,19 @@ def create_database():
         
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
+        conn = configure_connection(sqlite3.connect(DATABASE_FILE))
         print("Database connected.")
 
-        # --- Create 'stocks' table (SIMPLIFIED) ---
-        # Stores the static historical notes and the AI's dynamic "living document" JSON
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS stocks (
-            ticker TEXT PRIMARY KEY,
-            historical_level_notes TEXT,      -- Your critical, static historical context
-            company_overview_card_json TEXT,  -- The AI's full 6-part JSON output (Living Document)
-            last_updated TEXT                 -- Last date the AI updated the JSON
-        )
-        """)
-        print("Table 'stocks' created or already exists.")
-
-        # --- Create 'data_archive' table (Unchanged) ---
-        # Stores the raw 5-minute summary text and parsed data for historical reference
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data_archive (
-            archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticker TEXT,
-            date TEXT,
-            raw_text_summary TEXT,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            poc REAL,
-            vah REAL,
-            val REAL,
-            vwap REAL,
-            orl REAL,
-            orh REAL,
-            UNIQUE(ticker, date) -- Prevent duplicate entries for the same day
-        )
-        """)
-        print("Table 'data_archive' created or already exists.")
-
-        # --- Create 'market_context' table ---
-        # Stores the single, global "Economy Card"
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS market_context (
-            context_id INTEGER PRIMARY KEY CHECK (context_id = 1), -- Ensures only one row
-            economy_card_json TEXT,
-            last_updated TEXT
-        )
-        """)
-        print("Table 'market_context' created or already exists.")
-
-        # --- Initialize the single row for the economy card ---
-        cursor.execute("""
-        INSERT OR IGNORE INTO market_context (context_id, economy_card_json, last_updated)
-        VALUES (1, NULL, NULL)
-        """)
+        # All DDL and the seed row run as one immediate transaction: one commit (and fsync)
+        # instead of one per statement, and a failure leaves no half-created schema behind
+        conn.executescript(f"BEGIN IMMEDIATE;\n{SCHEMA_SQL}\nCOMMIT;")
+        print("Tables 'stocks', 'data_archive', 'market_context' created or already exist.")
         print("Initialized market_context row.")
-
-        conn.commit()
         print("Database schema created successfully.")
         
-        conn.commit()
-        print("Database schema created successfully.")
+        # Refresh planner statistics so the new index is picked for range queries
+        conn.execute("ANALYZE")
+        print("Planner statistics updated.")
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
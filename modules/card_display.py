@@ -18,12 +18,58 @@ import streamlit as st
 import textwrap
 
 # --- Helper Function ---
+# Escape $ (LaTeX math) and ~ (strikethrough) in one translate pass
+MARKDOWN_ESCAPES = str.maketrans({'$': '\\$', '~': '\\~'})
+
 def escape_markdown(text):
     """Escapes special Markdown characters in a string for safe rendering."""
     if not isinstance(text, str):
         return text
-    # Escape $ and ~
-    return text.replace('$', '\\$').replace('~', '\\~')
+    return text.translate(MARKDOWN_ESCAPES)
+
+def split_list_input(text):
+    """Splits a comma-separated text input into a list, dropping blanks (so '' -> [] rather than [''])."""
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+class EscapedFields:
+    """Mapping view for str.format_map: escaped `section[key]`, or 'N/A' when the key is missing."""
+    def __init__(self, section):
+        self.section = section
+
+    def __getitem__(self, key):
+        return escape_markdown(self.section.get(key, 'N/A'))
+
+# View-mode panels (heading + bullet list, one markdown element each),
+# dedented once at import; placeholders are card JSON keys
+FUNDAMENTAL_TEMPLATE = textwrap.dedent("""
+    ##### Fundamental Context
+    - **Valuation:** {valuation}
+    - **Analyst Sentiment:** {analystSentiment}
+    - **Insider Activity:** {insiderActivity}
+    - **Peer Performance:** {peerPerformance}
+""")
+SENTIMENT_TEMPLATE = textwrap.dedent("""
+    ##### Behavioral & Sentiment
+    - **Buyer vs. Seller:** {buyerVsSeller}
+    - **Emotional Tone:** {emotionalTone}
+    - **News Reaction:** {newsReaction}
+""")
+BASIC_CONTEXT_TEMPLATE = textwrap.dedent("""
+    ##### Basic Context
+    - **Company:** {companyDescription}
+    - **Sector:** {sector}
+    - **Recent Catalyst:** {recentCatalyst}
+""")
+TECHNICAL_TEMPLATE = textwrap.dedent("""
+    ##### Technical Structure
+    - **Major Support:** {majorSupport}
+    - **Major Resistance:** {majorResistance}
+    - **Key Action:** {keyAction}
+""")
+PARTICIPANTS_TEMPLATE = textwrap.dedent("""
+    - **Known Participants:** {knownParticipant}
+    - **Expected Participants:** {expectedParticipant}
+""")
 
 # --- VIEW MODE ---
 def display_view_market_note_card(card_data):
@@ -51,39 +97,18 @@ def display_view_market_note_card(card_data):
         col1, col2 = st.columns(2)
         with col1:
             with st.container(border=True):
-                st.markdown("##### Fundamental Context")
                 fund = data.get("fundamentalContext", {})
-                st.markdown(textwrap.dedent(f"""
-                    - **Valuation:** {escape_markdown(fund.get('valuation', 'N/A'))}
-                    - **Analyst Sentiment:** {escape_markdown(fund.get('analystSentiment', 'N/A'))}
-                    - **Insider Activity:** {escape_markdown(fund.get('insiderActivity', 'N/A'))}
-                    - **Peer Performance:** {escape_markdown(fund.get('peerPerformance', 'N/A'))}
-                """))
+                st.markdown(FUNDAMENTAL_TEMPLATE.format_map(EscapedFields(fund)))
             with st.container(border=True):
-                st.markdown("##### Behavioral & Sentiment")
                 sent = data.get("behavioralSentiment", {})
-                st.markdown(textwrap.dedent(f"""
-                    - **Buyer vs. Seller:** {escape_markdown(sent.get('buyerVsSeller', 'N/A'))}
-                    - **Emotional Tone:** {escape_markdown(sent.get('emotionalTone', 'N/A'))}
-                    - **News Reaction:** {escape_markdown(sent.get('newsReaction', 'N/A'))}
-                """))
+                st.markdown(SENTIMENT_TEMPLATE.format_map(EscapedFields(sent)))
         with col2:
             with st.container(border=True):
-                st.markdown("##### Basic Context")
                 ctx = data.get("basicContext", {})
-                st.markdown(textwrap.dedent(f"""
-                    - **Company:** {escape_markdown(ctx.get('companyDescription', 'N/A'))}
-                    - **Sector:** {escape_markdown(ctx.get('sector', 'N/A'))}
-                    - **Recent Catalyst:** {escape_markdown(ctx.get('recentCatalyst', 'N/A'))}
-                """))
+                st.markdown(BASIC_CONTEXT_TEMPLATE.format_map(EscapedFields(ctx)))
             with st.container(border=True):
-                st.markdown("##### Technical Structure")
                 tech = data.get("technicalStructure", {})
-                st.markdown(textwrap.dedent(f"""
-                    - **Major Support:** {escape_markdown(tech.get('majorSupport', 'N/A'))}
-                    - **Major Resistance:** {escape_markdown(tech.get('majorResistance', 'N/A'))}
-                    - **Key Action:** {escape_markdown(tech.get('keyAction', 'N/A'))}
-                """))
+                st.markdown(TECHNICAL_TEMPLATE.format_map(EscapedFields(tech)))
         st.divider()
 
         # Trade Plans
@@ -92,10 +117,7 @@ def display_view_market_note_card(card_data):
             st.markdown(f"#### {escape_markdown(plan_data.get('planName', 'N/A'))}")
             if "scenario" in plan_data and plan_data['scenario']:
                 st.info(f"**Scenario:** {escape_markdown(plan_data['scenario'])}")
-            st.markdown(textwrap.dedent(f"""
-                - **Known Participants:** {escape_markdown(plan_data.get('knownParticipant', 'N/A'))}
-                - **Expected Participants:** {escape_markdown(plan_data.get('expectedParticipant', 'N/A'))}
-            """))
+            st.markdown(PARTICIPANTS_TEMPLATE.format_map(EscapedFields(plan_data)))
             st.success(f"**Trigger:** {escape_markdown(plan_data.get('trigger', 'N/A'))}")
             st.error(f"**Invalidation:** {escape_markdown(plan_data.get('invalidation', 'N/A'))}")
 
@@ -275,8 +297,8 @@ def display_editable_economy_card(card_data, key_prefix="eco_edit"):
             with st.container(border=True):
                 st.markdown("##### Sector Rotation")
                 rotation = data.setdefault("sectorRotation", {})
-                rotation['leadingSectors'] = st.text_input("Leading Sectors (comma-separated)", ', '.join(rotation.get('leadingSectors', [])), key=f"{key_prefix}_sector_lead").split(', ')
-                rotation['laggingSectors'] = st.text_input("Lagging Sectors (comma-separated)", ', '.join(rotation.get('laggingSectors', [])), key=f"{key_prefix}_sector_lag").split(', ')
+                rotation['leadingSectors'] = split_list_input(st.text_input("Leading Sectors (comma-separated)", ', '.join(rotation.get('leadingSectors', [])), key=f"{key_prefix}_sector_lead"))
+                rotation['laggingSectors'] = split_list_input(st.text_input("Lagging Sectors (comma-separated)", ', '.join(rotation.get('laggingSectors', [])), key=f"{key_prefix}_sector_lag"))
                 rotation['rotationAnalysis'] = st.text_area("Rotation Analysis", rotation.get('rotationAnalysis', ''), height=150, key=f"{key_prefix}_sector_analysis")
 
         with col2:
@@ -0,0 +1,257 @@
+"""
+Shared market-data access for the processor and pipeline pages.
+
+Ticker lists and the cached yfinance fetch live here so that every page reads
+from the same `st.cache_data` entries instead of each page keeping its own copy.
+"""
+
+import streamlit as st
+import yfinance as yf
+import datetime as dt
+import threading
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+from zoneinfo import ZoneInfo
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday
+)
+from pandas.tseries.offsets import CustomBusinessDay
+from curl_cffi import requests as curl_requests
+
+# --- Ticker Grouping ---
+STOCK_TICKERS = [
+    "AAPL", "AMZN", "APP", "ABT", "PEP", "TSLA", "NVDA", "AMD",
+    "SNOW", "NET", "PLTR", "MU", "ORCL", "TSM"
+]
+ETF_TICKERS = [
+    "SPY", "QQQ", "IWM", "DIA", "TLT", "XLK", "XLF", "XLP", "XLE",
+    "SMH", "XLI", "XLV", "UUP", "GLD"
+]
+ALL_TICKERS = sorted(STOCK_TICKERS + ETF_TICKERS)
+KNOWN_TICKERS = frozenset(ALL_TICKERS)
+
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+MARKET_TZ = ZoneInfo("America/New_York")
+SESSION_START = dt.time(4, 0)
+SESSION_END = dt.time(20, 0)
+REGULAR_OPEN = dt.time(9, 30)
+REGULAR_CLOSE = dt.time(16, 0)
+EXTENDED_HOURS_REFRESH_SECONDS = 60 * 5
+REGULAR_HOURS_REFRESH_SECONDS = 60
+# Sessions whose per-ticker bars stay in the in-memory store, least recently used evicted first
+BAR_STORE_MAX_DAYS = 5
+
+
+# --- Trading Calendar ---
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """Full-day NYSE closures. Early closes are still trading days."""
+    rules = [
+        # NYSE does not close on Friday when New Year's Day falls on a Saturday
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+NYSE_BUSINESS_DAY = CustomBusinessDay(calendar=NYSEHolidayCalendar())
+
+def is_trading_day(day):
+    """Returns True if NYSE holds a session on `day`."""
+    return NYSE_BUSINESS_DAY.is_on_offset(pd.Timestamp(day))
+
+def previous_trading_day(day=None):
+    """Returns the last NYSE session before `day` (defaults to today in New York)."""
+    if day is None:
+        day = dt.datetime.now(MARKET_TZ).date()
+    return (pd.Timestamp(day) - NYSE_BUSINESS_DAY).date()
+
+
+# --- DATA FETCHING ---
+@st.cache_resource
+def get_yf_session():
+    """
+    Returns a process-wide HTTP session for yfinance so repeated downloads reuse
+    pooled keep-alive connections to Yahoo instead of a fresh TLS handshake each time.
+    """
+    return curl_requests.Session(impersonate="chrome")
+
+def reshape_wide_to_long(data):
+    """
+    Reshapes the wide (Ticker x Field) frame from `yf.download(group_by='ticker')`
+    into long format. The columns form a full product, so a plain ndarray reshape
+    replaces `DataFrame.stack` and its MultiIndex machinery.
+    """
+    tickers = data.columns.get_level_values(0).unique()
+    data = data.reindex(columns=pd.MultiIndex.from_product([tickers, OHLCV_COLUMNS]))
+    n_bars, n_tickers = len(data.index), len(tickers)
+
+    # Row-major layout is (bar, ticker, field), so each output row is one bar of one ticker.
+    values = data.to_numpy(dtype=np.float64).reshape(n_bars * n_tickers, len(OHLCV_COLUMNS))
+    long_df = pd.DataFrame(values, columns=OHLCV_COLUMNS)
+    long_df.insert(0, 'Ticker', pd.Categorical.from_codes(np.tile(np.arange(n_tickers), n_bars), categories=tickers))
+    long_df.insert(0, 'Datetime', data.index.repeat(n_tickers))
+    return long_df
+
+def downcast_bars(df):
+    """
+    Narrows a long-format bar frame to compact dtypes: float32 prices, uint32
+    volume and a categorical Ticker. Equity prices only need a few significant
+    digits, and a 5-minute bar's volume is far below the uint32 limit.
+    """
+    return df.astype({
+        'Ticker': 'category',
+        'Open': np.float32,
+        'High': np.float32,
+        'Low': np.float32,
+        'Close': np.float32,
+        'Volume': np.uint32,
+    })
+
+def _download_intraday(tickers_list, day, interval):
+    """Downloads intraday bars and returns them in long format. Raises on failure."""
+    start_time = dt.datetime.combine(day, SESSION_START)
+    end_time = dt.datetime.combine(day, SESSION_END)
+
+    data = yf.download(
+        tickers=tickers_list,
+        start=start_time,
+        end=end_time,
+        interval=interval,
+        group_by='ticker',
+        # yfinance fans the per-ticker requests out over its own thread pool
+        threads=True,
+        progress=False,
+        session=get_yf_session()
+    )
+
+    if data.empty:
+        return pd.DataFrame()
+
+    if isinstance(data.columns, pd.MultiIndex):
+        stacked_data = reshape_wide_to_long(data)
+    else:
+        # Build the columns straight from the index instead of reset_index + reorder
+        stacked_data = pd.DataFrame(data[OHLCV_COLUMNS].to_numpy(dtype=np.float64), columns=OHLCV_COLUMNS)
+        stacked_data.insert(0, 'Ticker', pd.Categorical([tickers_list[0]] * len(data.index)))
+        stacked_data.insert(0, 'Datetime', data.index)
+
+    stacked_data = stacked_data[stacked_data['Volume'] > 0]
+
+    return downcast_bars(stacked_data)
+
+@st.cache_data(ttl=None, persist="disk")
+def _fetch_intraday_historical(ticker, day, interval):
+    """
+    One ticker's bars for a completed past session. They never change, so they are kept
+    on disk without expiry, one entry per (ticker, day, interval).
+    """
+    stacked_data = _download_intraday([ticker], day, interval)
+    if stacked_data.empty:
+        # An empty download may be transient; raising keeps it out of the permanent cache.
+        raise LookupError(f"No {interval} bars for {ticker} on {day}.")
+    return stacked_data
+
+@st.cache_resource
+def _bar_store():
+    """
+    Process-wide per-ticker bar cache shared by every session. `days` maps each day to
+    {(ticker, interval): (freshness, frame)}, least recently used first; a freshness of
+    None marks a completed session. Hold `lock` while reading or changing it.
+    """
+    return {'lock': threading.Lock(), 'days': OrderedDict()}
+
+def _freshness_bucket(now):
+    """
+    Returns a cache-key stamp for today's data that rolls over every minute during
+    regular hours and every few minutes in the quieter extended sessions.
+    """
+    if REGULAR_OPEN <= now.time() < REGULAR_CLOSE:
+        period = REGULAR_HOURS_REFRESH_SECONDS
+    else:
+        period = EXTENDED_HOURS_REFRESH_SECONDS
+    seconds = now.hour * 3600 + now.minute * 60 + now.second
+    return (period, seconds // period)
+
+def _download_missing(tickers_list, day, interval, freshness):
+    """
+    Returns {ticker: frame} for tickers absent from the per-ticker store: today's bars in
+    one batched download, completed sessions through the per-ticker disk tier.
+    """
+    if freshness is None:
+        frames = {}
+        for ticker in tickers_list:
+            try:
+                frames[ticker] = _fetch_intraday_historical(ticker, day, interval)
+            except LookupError:
+                continue
+        return frames
+    fetched = _download_intraday(tickers_list, day, interval)
+    if fetched.empty:
+        return {}
+    return dict(iter(fetched.groupby('Ticker', observed=True, sort=False)))
+
+def fetch_intraday_data(tickers_list, day, interval="5m"):
+    """
+    Fetches intraday data for a list of tickers for a specific day.
+    Bars are cached per ticker, so changing the selection only downloads the
+    tickers that are not already held for the current freshness window.
+    """
+    # Weekends and holidays have no bars; skip the round-trip to Yahoo.
+    if not is_trading_day(day):
+        return pd.DataFrame()
+
+    try:
+        now = dt.datetime.now(MARKET_TZ)
+        # Once the extended session has closed, today's bars are final too.
+        if day < now.date() or (day == now.date() and now.time() >= SESSION_END):
+            freshness = None
+        else:
+            freshness = _freshness_bucket(now)
+
+        store = _bar_store()
+        tickers = list(dict.fromkeys(tickers_list))
+        found = {}
+        # Held across lookup and populate, so sessions asking for other days can't evict
+        # this day's entries in between (and the same bars aren't downloaded twice).
+        with store['lock']:
+            days = store['days']
+            day_bars = days.setdefault(day, {})
+            days.move_to_end(day)
+            while len(days) > BAR_STORE_MAX_DAYS:
+                days.popitem(last=False)
+
+            missing = []
+            for ticker in tickers:
+                entry = day_bars.get((ticker, interval))
+                if entry is not None and entry[0] == freshness:
+                    found[ticker] = entry[1]
+                else:
+                    missing.append(ticker)
+
+            if missing:
+                fetched = _download_missing(missing, day, interval, freshness)
+                for ticker, df_ticker in fetched.items():
+                    day_bars[(ticker, interval)] = (freshness, df_ticker)
+                found.update(fetched)
+
+        frames = [found[ticker] for ticker in tickers if ticker in found]
+
+        if not frames:
+            return pd.DataFrame()
+
+        stacked_data = pd.concat(frames, ignore_index=True)
+        stacked_data['Ticker'] = stacked_data['Ticker'].astype('category')
+        return stacked_data
+
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return pd.DataFrame()
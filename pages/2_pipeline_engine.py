@@ -3,9 +3,18 @@ import sqlite3
 import os
 import re
 import json
+import copy
+import threading
+import itertools
+import queue
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 # yfinance is no longer needed for this file
 from datetime import date, datetime, timedelta, timezone # Added timezone
 try:
@@ -19,13 +28,24 @@ except ImportError:
     US_EASTERN = timezone(timedelta(hours=-5)) # FallbackST
     BAHRAIN_TZ = timezone(timedelta(hours=3)) # Fallback to Bahrain time +03:00
 
-from deepdiff import DeepDiff
-import random # --- ADDED FOR RANDOM KEY SELECTION ---
+# orjson is optional; it decodes API responses and cards several times faster than stdlib json
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps_bytes = orjson.dumps
+    def json_dumps_pretty(obj): return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+except ImportError:
+    json_loads = json.loads
+    def json_dumps_bytes(obj): return json.dumps(obj).encode('utf-8')
+    def json_dumps_pretty(obj): return json.dumps(obj, indent=2)
+
 import textwrap
 from modules.card_display import display_view_market_note_card, display_editable_market_note_card, display_view_economy_card, display_editable_economy_card
 
-# --- Direct import from the processor page ---
-from pages.processor import generate_analysis_text, STOCK_TICKERS, ETF_TICKERS
+from modules.market_data import STOCK_TICKERS, ETF_TICKERS, previous_trading_day
+from database_setup import make_writer, ReadPool
+# pages.processor (the EOD analysis pass) is imported inside the "Run ... Processor" handlers,
+# so reruns that never press them don't load it
 
 # --- Constants ---
 DATABASE_FILE = "analysis_database.db"
@@ -35,6 +55,8 @@ API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}
 # --- *** NEW: Load Gemini API Keys from Secrets *** ---
 gemini_secrets = st.secrets.get("gemini", {})
 API_KEYS = gemini_secrets.get("api_keys", []) # Get the list of keys
+# Key -> position in API_KEYS for log lines, so retries don't rescan the list with .index()
+API_KEY_INDEX = {key: i for i, key in enumerate(API_KEYS)}
 # --- End New Section ---
 
 
@@ -86,6 +108,14 @@ DEFAULT_COMPANY_OVERVIEW_JSON = """
   }
 }
 """
+DEFAULT_COMPANY_OVERVIEW = json.loads(DEFAULT_COMPANY_OVERVIEW_JSON)
+
+def fresh_default_overview(ticker: str) -> dict:
+    """Returns a new copy of the default Company Overview Card filled in for `ticker`."""
+    card = copy.deepcopy(DEFAULT_COMPANY_OVERVIEW)
+    card["marketNote"] = card["marketNote"].replace("TICKER", ticker)
+    card["basicContext"]["tickerDate"] = card["basicContext"]["tickerDate"].replace("TICKER", ticker)
+    return card
 
 # --- NEW: Default JSON structure for the Economy Card ---
 DEFAULT_ECONOMY_CARD_JSON = """
@@ -128,8 +158,89 @@ CORE_INTERMARKET_EPICS = [
     "SPY", "US100", "US30", "IWM", "VIX", "TLT", "GOLD", "OIL_CRUDE", 
     "BTCUSD", "XLK", "XLF", "XLV", "SMH"
 ]
+# Concurrent Capital.com requests when fetching many epics at once
+CAPITAL_MAX_WORKERS = 8
+# Max epics accepted by a single Capital.com `GET /markets?epics=` request
+CAPITAL_MARKETS_BATCH_SIZE = 50
+# Capital.com allows 10 requests/second per user; shared by all concurrent fetches
+CAPITAL_REQUESTS_PER_SECOND = 10
+# Flattened `/prices` bar fields -> DataFrame columns (bid side, like the live snapshot)
+CAPITAL_BAR_COLUMNS = {
+    'snapshotTime': 'SnapshotTime',
+    'openPrice.bid': 'Open',
+    'highPrice.bid': 'High',
+    'lowPrice.bid': 'Low',
+    'closePrice.bid': 'Close',
+    'lastTradedVolume': 'Volume',
+}
 
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Returns a process-wide HTTP session for Capital.com and Gemini calls, so repeated
+    requests reuse pooled keep-alive connections instead of a new TLS handshake each time.
+    """
+    session = requests.Session()
+    # raise_on_status=False hands the final 429/503 back to the caller's own handling
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 503], raise_on_status=False)
+    # Keep a keep-alive connection per concurrent worker (Capital.com fan-out, one EOD thread per Gemini key)
+    # so none are opened and thrown away once the pool is full
+    pool_size = max(CAPITAL_MAX_WORKERS, len(API_KEYS), 10)
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries))
+    return session
+
+@st.cache_resource
+def get_db_connection() -> sqlite3.Connection:
+    """
+    Returns a long-lived SQLite connection shared across reruns and worker threads.
+    Callers must hold get_db_lock() while using it.
+    """
+    return make_writer()
+
+@st.cache_resource
+def get_db_lock() -> threading.Lock:
+    """Serializes use of the shared connection from get_db_connection()."""
+    return threading.Lock()
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() returns immediately while callers stay under `rate`
+    calls per second (with bursts up to `capacity`) and only sleeps when they get ahead of it.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate; self.capacity = capacity
+        self.tokens = capacity; self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1 # Reserve a token now; a negative balance is this caller's wait
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait: time.sleep(wait)
+
+@st.cache_resource
+def get_capital_rate_limiter() -> TokenBucket:
+    """Process-wide limiter for Capital.com REST calls."""
+    return TokenBucket(rate=CAPITAL_REQUESTS_PER_SECOND, capacity=CAPITAL_REQUESTS_PER_SECOND)
+
+@st.cache_resource
+def get_gemini_rate_limiter() -> TokenBucket:
+    """Paces back-to-back Gemini calls in the serial pre-market loop."""
+    return TokenBucket(rate=1.0, capacity=4)
+
+@st.cache_resource
+def get_proximity_column_config():
+    """Column formatting for the proximity scan table, built once per process instead of on every rerun."""
+    return {
+        "Proximity (%)": st.column_config.NumberColumn(format="%.2f"),
+        "Live Price": st.column_config.NumberColumn(format="$%.2f"),
+        "Support": st.column_config.NumberColumn(format="$%.2f"),
+        "Resistance": st.column_config.NumberColumn(format="$%.2f"),
+    }
+
 # --- Logger Class ---
 class AppLogger:
     def __init__(self, st_container=None):
@@ -151,41 +262,161 @@ class AppLogger:
             else: print(log_message)
         except Exception as e: self.log(f"Err format log: {e}"); self.log(str(data))
 
+class BufferedLogger:
+    """
+    Collects log calls made from worker threads (which cannot write to Streamlit)
+    so they can be replayed in order on the script thread.
+    """
+    def __init__(self):
+        self.entries = []
+    def log(self, message):
+        self.entries.append(('log', (message,)))
+    def log_code(self, data, language='json'):
+        self.entries.append(('log_code', (data, language)))
+    def flush_to(self, logger):
+        for method, args in self.entries: getattr(logger, method)(*args)
+        self.entries = []
+
+def script_thread_pool(max_workers: int) -> ThreadPoolExecutor:
+    """
+    ThreadPoolExecutor whose workers carry the current script run's context, so the
+    st.cache_data/st.cache_resource helpers they call resolve the same as on the script thread.
+    """
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx()))
+
+# --- Card Diff ---
+MISSING = object() # Marks a key present on only one side of diff_json
+
+def diff_json(old, new, path=""):
+    """
+    Yields (path, old_value, new_value) for every leaf that differs between two parsed
+    JSON values. Added or removed keys yield MISSING on the absent side.
+    """
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old.keys() | new.keys():
+            yield from diff_json(old.get(key, MISSING), new.get(key, MISSING), f"{path}.{key}" if path else key)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (old_item, new_item) in enumerate(zip(old, new)):
+            yield from diff_json(old_item, new_item, f"{path}[{i}]")
+    else:
+        yield path, old, new
+
+# --- SQL ---
+ARCHIVE_COLUMNS = ('ticker', 'date', 'raw_text_summary', 'open', 'high', 'low', 'close', 'poc', 'vah', 'val', 'vwap', 'orl', 'orh')
+# Fixed statement text so SQLite's per-connection statement cache can reuse the compiled INSERT
+ARCHIVE_INSERT_SQL = f"INSERT OR REPLACE INTO data_archive ({','.join(ARCHIVE_COLUMNS)}) VALUES ({','.join(['?'] * len(ARCHIVE_COLUMNS))})"
+# Shared statement text for the card reads/writes issued from several places;
+# sqlite3's statement cache is keyed on the SQL string, so one literal = one compiled program
+SELECT_STOCK_NOTES_SQL = "SELECT historical_level_notes, company_overview_card_json FROM stocks WHERE ticker = ?"
+UPDATE_STOCK_CARD_SQL = "UPDATE stocks SET company_overview_card_json=?, last_updated=? WHERE ticker=?"
+SELECT_ECONOMY_CARD_SQL = "SELECT economy_card_json FROM market_context WHERE context_id = 1"
+UPDATE_ECONOMY_CARD_SQL = "UPDATE market_context SET economy_card_json = ?, last_updated = ? WHERE context_id = 1"
+# Major S/R straight out of each stored EOD card; json_valid skips corrupt cards instead of raising per row
+PROXIMITY_LEVELS_SQL = (
+    "SELECT ticker,"
+    " json_extract(company_overview_card_json, '$.technicalStructure.majorSupport'),"
+    " json_extract(company_overview_card_json, '$.technicalStructure.majorResistance')"
+    " FROM stocks WHERE company_overview_card_json IS NOT NULL AND json_valid(company_overview_card_json)"
+)
+
 # --- Parsing Function (For EOD) ---
+# (field, compiled pattern, converter), compiled once per script run rather than per parse
+RAW_SUMMARY_PATTERNS = [
+    ('ticker', re.compile(r"Summary:\s*(\w+)", re.DOTALL), str),
+    ('date', re.compile(r"\|\s*([\d\-]+)", re.DOTALL), str),
+    ('open', re.compile(r"Open:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('close', re.compile(r"Close:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('high', re.compile(r"High.*:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('low', re.compile(r"Low.*:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('poc', re.compile(r"POC.*:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('vah', re.compile(r"VAH.*:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('val', re.compile(r"VAL.*:\s*\$([\d\.]+)", re.DOTALL), float),
+    ('vwap', re.compile(r"VWAP.*:\s*\$([\d\.]+)", re.DOTALL), float),
+]
+OPENING_RANGE_PATTERN = re.compile(r"Opening Range:\s*\$([\d\.]+)\s*-\s*\$([\d\.]+)")
+# First number in a free-text S/R field such as "$182.50 (Prior swing high)"
+LEVEL_NUMBER_PATTERN = re.compile(r'(\d+\.?\d*)')
+# Collapses the indentation/newlines of triple-quoted prompt snippets into single spaces
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
 def parse_raw_summary(raw_text: str) -> dict:
     """
     Parses the structured text summary from the 'Processor' app (for EOD).
     """
     data = {"raw_text_summary": raw_text}
-    def find_value(pattern, text, type_conv=float):
-        match = re.search(pattern, text, re.DOTALL)
+    for field, pattern, type_conv in RAW_SUMMARY_PATTERNS:
+        data[field] = None
+        match = pattern.search(raw_text)
         if match:
-            val_str = match.group(1).replace(',', '').strip();
-            if not val_str: return None
-            try: return type_conv(val_str)
-            except:
-                if type_conv == str: return val_str
-                return None
-        return None
-    data['ticker'] = find_value(r"Summary:\s*(\w+)", raw_text, str)
-    data['date'] = find_value(r"\|\s*([\d\-]+)", raw_text, str)
-    data['open'] = find_value(r"Open:\s*\$([\d\.]+)", raw_text)
-    data['close'] = find_value(r"Close:\s*\$([\d\.]+)", raw_text)
-    data['high'] = find_value(r"High.*:\s*\$([\d\.]+)", raw_text)
-    data['low'] = find_value(r"Low.*:\s*\$([\d\.]+)", raw_text)
-    data['poc'] = find_value(r"POC.*:\s*\$([\d\.]+)", raw_text)
-    data['vah'] = find_value(r"VAH.*:\s*\$([\d\.]+)", raw_text)
-    data['val'] = find_value(r"VAL.*:\s*\$([\d\.]+)", raw_text)
-    data['vwap'] = find_value(r"VWAP.*:\s*\$([\d\.]+)", raw_text)
-    or_match = re.search(r"Opening Range:\s*\$([\d\.]+)\s*-\s*\$([\d\.]+)", raw_text)
+            val_str = match.group(1).replace(',', '').strip()
+            if val_str:
+                try: data[field] = type_conv(val_str)
+                except: data[field] = val_str if type_conv == str else None
+    or_match = OPENING_RANGE_PATTERN.search(raw_text)
     data['orl'] = float(or_match.group(1)) if or_match else None
     data['orh'] = float(or_match.group(2)) if or_match else None
     return data
 
+@st.cache_data(ttl=86400, show_spinner=False)
+def parse_raw_summary_cached(raw_text: str) -> dict:
+    """
+    Memoized parse_raw_summary. The EOD runner and update_stock_note parse the same
+    summary text, and re-runs resubmit it; each caller gets its own copy of the dict.
+    """
+    return parse_raw_summary(raw_text)
+
+def strip_json_fence(ai_response_text: str) -> str:
+    """
+    Returns the body of the first ```json fenced block in an AI response,
+    or the whole response stripped if there is no complete fence.
+    """
+    text = ai_response_text.strip()
+    # Common case: the whole response is one fenced block, so slice between the first line and the closing fence
+    if text.startswith("```") and text.endswith("```") and "\n" in text:
+        body = text[text.index("\n") + 1:-3].strip()
+        if body and "```" not in body: return body
+    start = text.find("```json")
+    if start >= 0:
+        body, fence, _ = text[start + 7:].partition("```")
+        if fence and body.strip(): return body.strip()
+    return text
+
 # --- Gemini API Call Function ---
-def call_gemini_api(prompt: str, api_key: str, system_prompt: str, logger: AppLogger, max_retries=5) -> str:
+@st.cache_resource
+def get_api_key_rotation() -> dict:
+    """Process-wide round-robin cursor and per-key cooldowns shared by all Gemini callers."""
+    return {'cursor': itertools.count(), 'cooldown_until': {}, 'lock': threading.Lock()}
+
+def next_api_key(exclude: str = None) -> str:
+    """
+    Returns the next Gemini key in round-robin order, skipping `exclude` and keys still
+    cooling down after a 429/503. If every key is cooling down, returns the one free soonest.
+    """
+    rotation = get_api_key_rotation()
+    with rotation['lock']:
+        now = time.time()
+        for _ in range(len(API_KEYS)):
+            key = API_KEYS[next(rotation['cursor']) % len(API_KEYS)]
+            if key != exclude and rotation['cooldown_until'].get(key, 0) <= now:
+                return key
+        candidates = [key for key in API_KEYS if key != exclude] or API_KEYS
+        return min(candidates, key=lambda key: rotation['cooldown_until'].get(key, 0))
+
+def cool_down_key(api_key: str, seconds: float):
+    """Keeps `api_key` out of rotation for `seconds` after it was rate limited."""
+    rotation = get_api_key_rotation()
+    with rotation['lock']:
+        rotation['cooldown_until'][api_key] = time.time() + seconds
+
+class GeminiRateLimitedError(Exception):
+    """Raised by call_gemini_api(switch_keys=False) on a 429/503, so the caller can reschedule the key."""
+
+def call_gemini_api(prompt: str, api_key: str, system_prompt: str, logger: AppLogger, max_retries=5, switch_keys=True) -> str:
     """
     Calls the Gemini API, handles key switching and retries.
+    With switch_keys=False a 429/503 raises GeminiRateLimitedError instead of moving to another key.
     """
     current_api_key = api_key
     # Check if API_KEYS list is available and has keys
@@ -194,31 +425,32 @@ def call_gemini_api(prompt: str, api_key: str, system_prompt: str, logger: AppLo
          return None
          
     if not current_api_key or current_api_key not in API_KEYS: 
-        logger.log("Warning: Provided API key invalid or missing, selecting one at random.")
-        current_api_key = random.choice(API_KEYS) # Select random key
+        logger.log("Warning: Provided API key invalid or missing, selecting the next one in rotation.")
+        current_api_key = next_api_key()
         
     for i in range(max_retries):
         gemini_api_url = f"{API_URL}?key={current_api_key}"
         payload = {"contents": [{"parts": [{"text": prompt}]}], "systemInstruction": {"parts": [{"text": system_prompt}]}}
         headers = {'Content-Type': 'application/json'}
-        current_key_index = API_KEYS.index(current_api_key) # Will raise ValueError if key not in list, but we checked
+        current_key_index = API_KEY_INDEX[current_api_key]
         try:
-            response = requests.post(gemini_api_url, headers=headers, data=json.dumps(payload), timeout=90)
+            response = get_http_session().post(gemini_api_url, headers=headers, data=json_dumps_bytes(payload), timeout=90)
             if response.status_code in [429, 503]:
+                if not switch_keys:
+                    logger.log(f"API Error {response.status_code} on Key #{current_key_index + 1}.")
+                    raise GeminiRateLimitedError(response.status_code)
                 logger.log(f"API Error {response.status_code} on Key #{current_key_index + 1}. Switching...")
+                cool_down_key(current_api_key, 2**i)
                 if len(API_KEYS) > 1:
-                    new_key_index = random.randint(0, len(API_KEYS) - 1)
-                    while new_key_index == current_key_index:
-                        new_key_index = random.randint(0, len(API_KEYS) - 1)
-                    current_api_key = API_KEYS[new_key_index]
-                    logger.log(f"   ...Switched to random Key #{new_key_index + 1}.")
+                    current_api_key = next_api_key(exclude=current_api_key)
+                    logger.log(f"   ...Switched to Key #{API_KEY_INDEX[current_api_key] + 1}.")
                 else: logger.log("   ...Cannot switch (only one key). Retrying same key.")
                 delay = 2**i; logger.log(f"   ...Retry in {delay}s..."); time.sleep(delay); continue
             elif response.status_code != 200:
                 logger.log(f"API Error {response.status_code}: {response.text} (Key #{current_key_index + 1})")
                 if i < max_retries - 1: delay = 2**i; logger.log(f"   ...Retry in {delay}s..."); time.sleep(delay); continue
                 else: logger.log("   ...Final fail."); return None
-            result = response.json()
+            result = json_loads(response.content)
             candidates = result.get("candidates")
             if candidates and len(candidates) > 0:
                 content = candidates[0].get("content")
@@ -239,6 +471,39 @@ def call_gemini_api(prompt: str, api_key: str, system_prompt: str, logger: AppLo
             if i < max_retries - 1: time.sleep(2**i)
     logger.log(f"API failed after {max_retries} retries."); return None
 
+class GeminiKeyPool:
+    """
+    Hands each Gemini key to one caller at a time, so every key has at most one request in
+    flight. A key that hits a 429/503 rejoins the pool only after its cooldown, on a timer,
+    so no worker sleeps while holding it and the next call goes to a key that is free.
+    """
+    def __init__(self, keys: list):
+        self.size = len(keys)
+        self.keys = queue.Queue()
+        for key in keys: self.keys.put(key)
+
+    def release_after(self, key: str, delay: float):
+        timer = threading.Timer(delay, self.keys.put, (key,)); timer.daemon = True; timer.start()
+
+    def call(self, prompt: str, system_prompt: str, logger: AppLogger, max_attempts=5) -> str:
+        if not self.size:
+            logger.log("Error: No Gemini API keys found in st.secrets."); return None
+        for attempt in range(max_attempts):
+            key = self.keys.get()
+            try:
+                result = call_gemini_api(prompt, key, system_prompt, logger, switch_keys=False)
+            except GeminiRateLimitedError:
+                delay = 2**attempt
+                cool_down_key(key, delay) # Keep the serial next_api_key() callers off it too
+                logger.log(f"   ...Key #{API_KEY_INDEX[key] + 1} back in the pool in {delay}s; retrying on the next free key.")
+                self.release_after(key, delay)
+                continue
+            except Exception:
+                self.keys.put(key); raise
+            self.keys.put(key)
+            return result
+        logger.log(f"API still rate limited after {max_attempts} attempts."); return None
+
 # --- NEW HELPER: Run Processor Script ---
 def run_processor_script(processor_type: str, logger: AppLogger) -> str:
     """
@@ -280,42 +545,46 @@ def run_processor_script(processor_type: str, logger: AppLogger) -> str:
 
 
 # --- Workflow #1: Daily Note Generator (Unchanged) ---
-def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_summary: str, api_key_to_use: str, logger: AppLogger):
+def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_summary: str, api_key_to_use: str, logger: AppLogger, key_pool: GeminiKeyPool | None = None):
     """
     Updates the main EOD card in the database based on the EOD processor text.
+    If `key_pool` is given, the Gemini call takes its key from the pool instead of `api_key_to_use`.
     """
     logger.log(f"--- Starting EOD update for {ticker_to_update} ---")
-    conn = None
+    conn = get_db_connection(); db_lock = get_db_lock()
     try:
-        conn = sqlite3.connect(DATABASE_FILE); conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-        logger.log("1. Parsing raw summary..."); parsed_data = parse_raw_summary(new_raw_text)
+        logger.log("1. Parsing raw summary..."); parsed_data = parse_raw_summary_cached(new_raw_text)
         trade_date = parsed_data.get('date', date.today().isoformat())
         ticker_from_parse = parsed_data.get('ticker')
         if not ticker_from_parse: logger.log(f"Warn: No Ticker parsed for {ticker_to_update}. Using provided.");
         elif ticker_from_parse != ticker_to_update: logger.log(f"Warn: Ticker mismatch ({ticker_from_parse} vs {ticker_to_update}). Using {ticker_from_parse}."); ticker_to_update = ticker_from_parse
         if not ticker_to_update: logger.log("Error: No ticker."); return
         
-        logger.log("2. Archiving raw data...");
-        archive_columns = ['ticker','date','raw_text_summary','open','high','low','close','poc','vah','val','vwap','orl','orh']
+        logger.log("2. Fetching Historical Notes & Yesterday's EOD Card...");
+        with db_lock:
+            company_data = conn.execute(SELECT_STOCK_NOTES_SQL, (ticker_to_update,)).fetchone()
+
+        logger.log("3. Archiving raw data...");
         parsed_data['ticker'] = ticker_to_update
-        archive_values = tuple(parsed_data.get(col) for col in archive_columns)
-        cursor.execute(f"INSERT OR REPLACE INTO data_archive ({','.join(archive_columns)}) VALUES ({','.join(['?']*len(archive_columns))})", archive_values)
-        conn.commit(); logger.log("   ...archived.")
-        
-        logger.log("3. Fetching Historical Notes & Yesterday's EOD Card...");
-        cursor.execute("SELECT historical_level_notes, company_overview_card_json FROM stocks WHERE ticker = ?", (ticker_to_update,))
-        company_data = cursor.fetchone(); previous_overview_card_dict={}; historical_notes=""
+        archive_values = tuple(parsed_data.get(col) for col in ARCHIVE_COLUMNS)
+        try:
+            # Archive row and (if needed) the new stocks row commit together: one fsync per ticker before the AI call
+            with db_lock, conn:
+                conn.execute(ARCHIVE_INSERT_SQL, archive_values)
+                if not company_data: conn.execute("INSERT OR IGNORE INTO stocks (ticker) VALUES (?)", (ticker_to_update,))
+        except Exception as db_err: logger.log(f"   ...Error archiving: {db_err}"); return
+        logger.log("   ...archived.")
+
+        previous_overview_card_dict={}; historical_notes=""
         if company_data:
             historical_notes = company_data["historical_level_notes"] or ""
             if company_data['company_overview_card_json']:
-                try: previous_overview_card_dict = json.loads(company_data['company_overview_card_json']); logger.log("   ...found yesterday's EOD card.")
-                except: logger.log(f"   ...Warn: Parse fail yesterday's EOD card."); previous_overview_card_dict = json.loads(DEFAULT_COMPANY_OVERVIEW_JSON.replace("TICKER", ticker_to_update))
-            else: logger.log(f"   ...No prior EOD card. Creating new."); previous_overview_card_dict = json.loads(DEFAULT_COMPANY_OVERVIEW_JSON.replace("TICKER", ticker_to_update))
+                try: previous_overview_card_dict = json_loads(company_data['company_overview_card_json']); logger.log("   ...found yesterday's EOD card.")
+                except: logger.log(f"   ...Warn: Parse fail yesterday's EOD card."); previous_overview_card_dict = fresh_default_overview(ticker_to_update)
+            else: logger.log(f"   ...No prior EOD card. Creating new."); previous_overview_card_dict = fresh_default_overview(ticker_to_update)
         else:
-            logger.log(f"   ...No DB entry. Creating row.");
-            try: cursor.execute("INSERT OR IGNORE INTO stocks (ticker) VALUES (?)", (ticker_to_update,)); conn.commit(); logger.log(f"   ...Created row.")
-            except Exception as insert_err: logger.log(f"   ...Error creating row: {insert_err}"); return
-            previous_overview_card_dict = json.loads(DEFAULT_COMPANY_OVERVIEW_JSON.replace("TICKER", ticker_to_update))
+            logger.log(f"   ...No prior DB entry. Created row.");
+            previous_overview_card_dict = fresh_default_overview(ticker_to_update)
 
         logger.log("4. Building EOD Note Generator Prompt...");
         note_generator_system_prompt = (
@@ -333,7 +602,7 @@ def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_su
 
         [Yesterday's Company Overview Card for {ticker_to_update}] 
         (This defines the ESTABLISHED structure, plans, and the story so far in `keyAction`. Update this cautiously based on MAJOR level interaction.) 
-        {json.dumps(previous_overview_card_dict, indent=2)}
+        {json_dumps_pretty(previous_overview_card_dict)}
 
         [Today's New Price Action Summary]
         (Objective 5-minute data representing the full completed trading day.)
@@ -360,14 +629,15 @@ def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_su
         """
         
         logger.log(f"5. Calling EOD AI Analyst...");
-        ai_response_text = call_gemini_api(prompt, api_key_to_use, note_generator_system_prompt, logger)
+        if key_pool: ai_response_text = key_pool.call(prompt, note_generator_system_prompt, logger)
+        else: ai_response_text = call_gemini_api(prompt, api_key_to_use, note_generator_system_prompt, logger)
         if not ai_response_text: logger.log("Error: No AI response."); return
         
         logger.log("6. Received EOD Card JSON. Parsing & Comparing...");
-        json_match = re.search(r"```json\s*([\s\S]+?)\s*```", ai_response_text); ai_response_text = json_match.group(1) if json_match else ai_response_text.strip()
+        ai_response_text = strip_json_fence(ai_response_text)
         new_overview_card_dict = None
         try:
-            full_parsed_json = json.loads(ai_response_text)
+            full_parsed_json = json_loads(ai_response_text)
             if isinstance(full_parsed_json, list) and full_parsed_json: new_overview_card_dict = full_parsed_json[0]
             elif isinstance(full_parsed_json, dict): new_overview_card_dict = full_parsed_json
             else: raise json.JSONDecodeError("Not dict/list.", ai_response_text, 0)
@@ -382,20 +652,24 @@ def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_su
         if missing_keys or missing_open or missing_alt: logger.log(f"Missing keys: T({missing_keys}), O({missing_open}), A({missing_alt}). Abort.\n{json.dumps(new_overview_card_dict, indent=2)}"); return
         
         logger.log("   ...JSON parsed & validated.")
-        try: # DeepDiff
-            diff=DeepDiff(previous_overview_card_dict, new_overview_card_dict, ignore_order=True, view='tree')
+        try: # Card diff
+            diff=list(diff_json(previous_overview_card_dict, new_overview_card_dict))
             if not diff: logger.log("   ...No changes.")
             else:
-                changes_log="   **Changes detected:**\n"; changes_found=False
-                if 'values_changed' in diff:
-                    changes_log+="| Field | Old | New |\n|---|---|---|\n"; changes_found=True
-                    for change in diff['values_changed']:
-                        path=change.path().replace("root","").replace("['",".").replace("']","").strip('.'); path=path or"(root)"
-                        old=change.t1; new=change.t2; old_s=json.dumps(old,ensure_ascii=False) if isinstance(old,(dict,list)) else str(old); new_s=json.dumps(new,ensure_ascii=False) if isinstance(new,(dict,list)) else str(new)
+                changes_log="   **Changes detected:**\n"
+                values_changed=[(path, old, new) for path, old, new in diff if old is not MISSING and new is not MISSING]
+                keys_added=[path for path, old, new in diff if old is MISSING]; keys_removed=[path for path, old, new in diff if new is MISSING]
+                if values_changed:
+                    changes_log+="| Field | Old | New |\n|---|---|---|\n"
+                    for path, old, new in values_changed:
+                        path=path or"(root)"
+                        old_s=json.dumps(old,ensure_ascii=False) if isinstance(old,(dict,list)) else str(old); new_s=json.dumps(new,ensure_ascii=False) if isinstance(new,(dict,list)) else str(new)
                         old_s=(old_s[:50]+'...') if len(old_s)>53 else old_s; new_s=(new_s[:50]+'...') if len(new_s)>53 else new_s
                         changes_log+=f"| `{path}` | `{old_s}` | `{new_s}` |\n"
-                if not changes_found and ('dictionary_item_added' in diff or 'dictionary_item_removed' in diff): changes_log+="   ...Structural changes only.\n"
-                elif changes_found: logger.log(changes_log)
+                else: changes_log+="   ...Structural changes only.\n"
+                if keys_added: changes_log+=f"   Added keys: {', '.join(f'`{path}`' for path in keys_added)}\n"
+                if keys_removed: changes_log+=f"   Removed keys: {', '.join(f'`{path}`' for path in keys_removed)}\n"
+                logger.log(changes_log)
         except Exception as e: logger.log(f"   ...Error comparing: {e}.")
         
         logger.log(f"   ...AI Confidence: `{new_overview_card_dict.get('confidence','N/A')}`")
@@ -403,13 +677,12 @@ def update_stock_note(ticker_to_update: str, new_raw_text: str, macro_context_su
         logger.log(f"   ...AI Plan: `{new_overview_card_dict.get('openingTradePlan',{}).get('planName','N/A')}`")
         
         logger.log("7. Saving NEW EOD Card..."); today_str=date.today().isoformat()
-        new_json_str=json.dumps(new_overview_card_dict, indent=2)
-        cursor.execute("UPDATE stocks SET company_overview_card_json=?, last_updated=? WHERE ticker=?", (new_json_str, today_str, ticker_to_update))
-        if cursor.rowcount==0: logger.log(f"   ...Warn: Update fail {ticker_to_update} (row 0). Init first.")
-        else: conn.commit(); logger.log(f"--- Success EOD update {ticker_to_update} ---")
+        new_json_str=json_dumps_pretty(new_overview_card_dict)
+        with db_lock, conn:
+            updated_rows = conn.execute(UPDATE_STOCK_CARD_SQL, (new_json_str, today_str, ticker_to_update)).rowcount
+        if updated_rows==0: logger.log(f"   ...Warn: Update fail {ticker_to_update} (row 0). Init first.")
+        else: logger.log(f"--- Success EOD update {ticker_to_update} ---")
     except Exception as e: logger.log(f"Unexpected error in EOD update: `{e}`")
-    finally:
-        if conn: conn.close()
 
 
 
@@ -419,20 +692,16 @@ def update_economy_card(manual_summary: str, etf_summaries_text: str, api_key_to
     Updates the global Economy Card in the database using AI.
     """
     logger.log("--- Starting Economy Card EOD Update ---")
-    conn = None
+    conn = get_db_connection(); db_lock = get_db_lock()
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
         logger.log("1. Fetching previous day's Economy Card...")
-        cursor.execute("SELECT economy_card_json FROM market_context WHERE context_id = 1")
-        eco_data = cursor.fetchone()
+        with db_lock:
+            eco_data = conn.execute(SELECT_ECONOMY_CARD_SQL).fetchone()
         
         previous_economy_card_dict = {}
         if eco_data and eco_data['economy_card_json']:
             try:
-                previous_economy_card_dict = json.loads(eco_data['economy_card_json'])
+                previous_economy_card_dict = json_loads(eco_data['economy_card_json'])
                 logger.log("   ...found previous Economy Card.")
             except json.JSONDecodeError:
                 logger.log("   ...Warn: Could not parse previous card, starting from default.")
@@ -462,7 +731,7 @@ def update_economy_card(manual_summary: str, etf_summaries_text: str, api_key_to
         [DATA]
         1.  **Previous Day's Economy Card:**
             (This is the established macro context and narrative.)
-            {json.dumps(previous_economy_card_dict, indent=2)}
+            {json_dumps_pretty(previous_economy_card_dict)}
 
         2.  **User's Manual Daily Summary:**
             (This is the user's high-level take on the day's events. Give this high importance for the `marketNarrative`.)
@@ -491,11 +760,10 @@ def update_economy_card(manual_summary: str, etf_summaries_text: str, api_key_to
             return
 
         logger.log("4. Parsing and validating new Economy Card...")
-        json_match = re.search(r"```json\s*([\s\S]+?)\s*```", ai_response_text)
-        ai_response_text = json_match.group(1) if json_match else ai_response_text.strip()
+        ai_response_text = strip_json_fence(ai_response_text)
 
         try:
-            new_economy_card_dict = json.loads(ai_response_text)
+            new_economy_card_dict = json_loads(ai_response_text)
             # Basic validation
             if "marketNarrative" not in new_economy_card_dict or "sectorRotation" not in new_economy_card_dict:
                 raise ValueError("Validation failed: Key fields missing from AI response.")
@@ -504,10 +772,9 @@ def update_economy_card(manual_summary: str, etf_summaries_text: str, api_key_to
             logger.log(f"   ...New Market Narrative: {new_economy_card_dict.get('marketNarrative', 'N/A')}")
 
             logger.log("5. Saving new Economy Card to database...")
-            new_json_str = json.dumps(new_economy_card_dict, indent=2)
-            cursor.execute("UPDATE market_context SET economy_card_json = ?, last_updated = ? WHERE context_id = 1",
-                           (new_json_str, date.today().isoformat()))
-            conn.commit()
+            new_json_str = json_dumps_pretty(new_economy_card_dict)
+            with db_lock, conn:
+                conn.execute(UPDATE_ECONOMY_CARD_SQL, (new_json_str, date.today().isoformat()))
             logger.log("--- Success: Economy Card EOD update complete! ---")
 
         except (json.JSONDecodeError, ValueError) as e:
@@ -516,9 +783,6 @@ def update_economy_card(manual_summary: str, etf_summaries_text: str, api_key_to
 
     except Exception as e:
         logger.log(f"An unexpected error occurred in update_economy_card: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 
 
@@ -529,39 +793,31 @@ def generate_premarket_economy_card(premarket_macro_news: str, logger: AppLogger
     Creates a temporary, tactical Pre-Market Economy Card using EOD card, manual news, AND live ETF data.
     """
     logger.log("--- Starting Pre-Market Economy Card Generation ---")
-    conn = None
     try:
         # --- Step 1: Fetch Live Pre-Market Data for Core Inter-Market Epics ---
         logger.log(f"1. Fetching live pre-market data for {len(CORE_INTERMARKET_EPICS)} core epics...")
+        live_prices, bar_dataframes = fetch_premarket_market_data(CORE_INTERMARKET_EPICS, cst, xst, logger)
         etf_pm_summaries = []
-        for i, epic in enumerate(CORE_INTERMARKET_EPICS):
-            logger.log(f"   ...Processing {epic}...")
-            bid, offer = get_capital_current_price(epic, cst, xst, logger)
-            if bid and offer:
-                live_price = (bid + offer) / 2
-                df_5m = get_capital_price_bars(epic, cst, xst, "MINUTE_5", logger)
-                if df_5m is not None: # Can be an empty DataFrame
-                    summary = process_premarket_bars_to_summary(epic, df_5m, live_price, logger)
-                    etf_pm_summaries.append(summary)
-            if i < len(CORE_INTERMARKET_EPICS) - 1: time.sleep(0.33)
+        for epic in CORE_INTERMARKET_EPICS:
+            live_price = live_prices.get(epic)
+            df_5m = bar_dataframes.get(epic)
+            if live_price and df_5m is not None: # Bars can be an empty DataFrame
+                summary = process_premarket_bars_to_summary(epic, df_5m, live_price, logger)
+                etf_pm_summaries.append(summary)
         
         etf_pm_summaries_text = "\n".join(etf_pm_summaries)
         if not etf_pm_summaries_text:
             logger.log("   ...Warning: Could not fetch any live pre-market data. Context will be limited.")
 
         # --- Step 2: Fetch EOD Economy Card ---
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
         logger.log("2. Fetching latest EOD Economy Card from DB...")
-        cursor.execute("SELECT economy_card_json FROM market_context WHERE context_id = 1")
-        eco_data = cursor.fetchone()
+        with get_read_pool().acquire() as conn:
+            eco_data = conn.execute(SELECT_ECONOMY_CARD_SQL).fetchone()
         
         eod_economy_card_dict = {}
         if eco_data and eco_data['economy_card_json']:
             try:
-                eod_economy_card_dict = json.loads(eco_data['economy_card_json'])
+                eod_economy_card_dict = json_loads(eco_data['economy_card_json'])
                 st.session_state['eod_economy_card'] = eod_economy_card_dict # Cache it
                 logger.log("   ...found EOD Economy Card.")
             except json.JSONDecodeError:
@@ -591,7 +847,7 @@ def generate_premarket_economy_card(premarket_macro_news: str, logger: AppLogger
         [DATA]
         1.  **Strategic EOD Economy Card (Yesterday's Close):**
             (This is the established macro context. Your task is to ADD to it, not replace it.)
-            {json.dumps(eod_economy_card_dict, indent=2)}
+            {json_dumps_pretty(eod_economy_card_dict)}
 
         2.  **Live Pre-Market Data (Objective Action):**
             (This is the most important data for determining the immediate tactical bias. How are the indices, bonds, gold, oil, and key sectors behaving right now?)
@@ -615,7 +871,7 @@ def generate_premarket_economy_card(premarket_macro_news: str, logger: AppLogger
         """
 
         logger.log("4. Calling Pre-Market Macro AI...")
-        key_to_use = random.choice(API_KEYS)
+        key_to_use = next_api_key()
         ai_response_text = call_gemini_api(prompt, key_to_use, system_prompt, logger)
 
         if not ai_response_text:
@@ -624,11 +880,10 @@ def generate_premarket_economy_card(premarket_macro_news: str, logger: AppLogger
             return False
 
         logger.log("5. Parsing and saving new Pre-Market Economy Card to session state...")
-        json_match = re.search(r"```json\s*([\s\S]+?)\s*```", ai_response_text)
-        ai_response_text = json_match.group(1) if json_match else ai_response_text.strip()
+        ai_response_text = strip_json_fence(ai_response_text)
 
         try:
-            premarket_economy_card_dict = json.loads(ai_response_text)
+            premarket_economy_card_dict = json_loads(ai_response_text)
             st.session_state['premarket_economy_card'] = premarket_economy_card_dict
             logger.log("--- Success: Pre-Market Economy Card generated and saved to session state. ---")
             return True
@@ -642,9 +897,6 @@ def generate_premarket_economy_card(premarket_macro_news: str, logger: AppLogger
         logger.log(f"An unexpected error occurred in generate_premarket_economy_card: {e}")
         st.session_state['premarket_economy_card'] = None
         return False
-    finally:
-        if conn:
-            conn.close()
 
             
 # ---
@@ -674,7 +926,7 @@ def create_capital_session(_logger: AppLogger): # Logger marked to be ignored by
     payload = {"identifier": identifier, "password": password}
     
     try:
-        response = requests.post(session_url, headers=headers, json=payload, timeout=10)
+        response = get_http_session().post(session_url, headers=headers, json=payload, timeout=10)
         response.raise_for_status()
         cst_token = response.headers.get('CST')
         security_token = response.headers.get('X-SECURITY-TOKEN')
@@ -700,9 +952,10 @@ def get_capital_current_price(epic: str, cst: str, xst: str, logger: AppLogger):
     url = f"https://api-capital.backend-capital.com/api/v1/markets/{epic}"
     headers = {'X-SECURITY-TOKEN': xst, 'CST': cst}
     try:
-        response = requests.get(url, headers=headers, timeout=5)
+        get_capital_rate_limiter().acquire()
+        response = get_http_session().get(url, headers=headers, timeout=5)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         snapshot = data.get('snapshot')
         if snapshot and 'bid' in snapshot and 'offer' in snapshot:
             return snapshot['bid'], snapshot['offer']
@@ -716,12 +969,93 @@ def get_capital_current_price(epic: str, cst: str, xst: str, logger: AppLogger):
             logger.log(f"   ...Error fetching live price for {epic}: {e}")
         return None, None
 
-def get_capital_price_bars(epic: str, cst: str, xst: str, resolution: str, logger: AppLogger) -> pd.DataFrame | None:
+def get_capital_current_prices(epics: list, cst: str, xst: str, logger: AppLogger) -> dict | None:
+    """
+    Gets the live bid/offer for up to CAPITAL_MARKETS_BATCH_SIZE epics in one request.
+    Returns {epic: (bid, offer)}, or None if the batch request itself failed.
+    """
+    url = "https://api-capital.backend-capital.com/api/v1/markets"
+    headers = {'X-SECURITY-TOKEN': xst, 'CST': cst}
+    try:
+        get_capital_rate_limiter().acquire()
+        response = get_http_session().get(url, headers=headers, params={'epics': ','.join(epics)}, timeout=10)
+        response.raise_for_status()
+        prices = {}
+        for market in json_loads(response.content).get('marketDetails', []):
+            epic = market.get('instrument', {}).get('epic')
+            snapshot = market.get('snapshot') or {}
+            if epic and 'bid' in snapshot and 'offer' in snapshot:
+                prices[epic] = (snapshot['bid'], snapshot['offer'])
+        for epic in epics:
+            if epic not in prices: logger.log(f"   ...Warn ({epic}): Live price not in batch snapshot.")
+        return prices
+    except Exception as e:
+        logger.log(f"   ...Error fetching batch live prices ({len(epics)} epics): {e}")
+        return None
+
+def fetch_live_prices(epics: list, cst: str, xst: str, logger: AppLogger) -> dict:
+    """
+    Fetches live mid prices for many epics using batched `/markets` requests,
+    running the batches concurrently. A batch that fails falls back to per-epic calls.
+    Returns a dict of {epic: mid_price} for the epics that returned a bid/offer.
+    """
+    def fetch_batch(batch):
+        buffer = BufferedLogger()
+        quotes = get_capital_current_prices(batch, cst, xst, buffer)
+        if quotes is None:
+            quotes = {epic: get_capital_current_price(epic, cst, xst, buffer) for epic in batch}
+        return quotes, buffer
+
+    batches = [epics[i:i + CAPITAL_MARKETS_BATCH_SIZE] for i in range(0, len(epics), CAPITAL_MARKETS_BATCH_SIZE)]
+    live_prices = {}
+    with script_thread_pool(CAPITAL_MAX_WORKERS) as executor:
+        for quotes, buffer in executor.map(fetch_batch, batches):
+            buffer.flush_to(logger)
+            for epic, (bid, offer) in quotes.items():
+                if bid and offer:
+                    live_prices[epic] = (bid + offer) / 2
+    return live_prices
+
+def fetch_premarket_market_data(epics: list, cst: str, xst: str, logger: AppLogger) -> tuple[dict, dict]:
+    """
+    Fetches live prices and today's 5-min pre-market bars for many epics concurrently.
+    Returns ({epic: mid_price}, {epic: DataFrame}); a bars frame may be empty if nothing traded.
+    """
+    live_prices = fetch_live_prices(epics, cst, xst, logger)
+    premarket_window = get_premarket_window_utc()
+
+    def fetch_bars(epic):
+        buffer = BufferedLogger()
+        return epic, get_capital_price_bars(epic, cst, xst, "MINUTE_5", buffer, premarket_window), buffer
+
+    bar_dataframes = {}
+    with script_thread_pool(CAPITAL_MAX_WORKERS) as executor:
+        for epic, df_5m, buffer in executor.map(fetch_bars, epics):
+            buffer.flush_to(logger)
+            if df_5m is not None:
+                bar_dataframes[epic] = df_5m
+    return live_prices, bar_dataframes
+
+def get_premarket_window_utc() -> tuple[pd.Timestamp, pd.Timestamp]:
+    """Returns today's pre-market window (4:00 - 9:30 ET) as UTC timestamps, end exclusive."""
+    today_et = datetime.now(US_EASTERN).date()
+    midnight_et = pd.Timestamp(datetime.combine(today_et, datetime.min.time())).tz_localize(US_EASTERN)
+    pm_start_utc = (midnight_et + pd.Timedelta(hours=PREMARKET_START_HOUR)).tz_convert('UTC')
+    pm_end_utc = (midnight_et + pd.Timedelta(hours=PREMARKET_END_HOUR, minutes=PREMARKET_END_MINUTE)).tz_convert('UTC')
+    return pm_start_utc, pm_end_utc
+
+def get_capital_price_bars(epic: str, cst: str, xst: str, resolution: str, logger: AppLogger, premarket_window: tuple | None = None) -> pd.DataFrame | None:
     """
     Fetches price bars for a given resolution, filtering for today's pre-market.
+    Callers fetching many epics can pass `premarket_window` from get_premarket_window_utc() to compute it once.
     """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(hours=16) # Fetch last 16 hours
+    pm_start_utc, pm_end_utc = premarket_window or get_premarket_window_utc()
+    # Only request today's pre-market window (or up to now) rather than the last 16 hours
+    start_date = pm_start_utc
+    end_date = min(pd.Timestamp.now(tz='UTC'), pm_end_utc)
+    if end_date <= start_date:
+        logger.log(f"   ...Pre-market has not started yet; no bars to fetch for {epic}.")
+        return pd.DataFrame()
     
     price_params = {"resolution": resolution, 'max': 1000, 'from': start_date.strftime('%Y-%m-%dT%H:%M:%S'), 'to': end_date.strftime('%Y-%m-%dT%H:%M:%S')}
     headers = {'X-SECURITY-TOKEN': xst, 'CST': cst}
@@ -729,40 +1063,31 @@ def get_capital_price_bars(epic: str, cst: str, xst: str, resolution: str, logge
     price_history_url = f"https://api-capital.backend-capital.com/api/v1/prices/{epic}"
     
     try:
-        response = requests.get(price_history_url, headers=headers, params=price_params, timeout=10)
+        get_capital_rate_limiter().acquire()
+        response = get_http_session().get(price_history_url, headers=headers, params=price_params, timeout=10)
         response.raise_for_status()
-        price_data = response.json()
+        price_data = json_loads(response.content)
         prices = price_data.get('prices', [])
         if not prices:
             logger.log(f"   ...No price bars returned for {epic} (resolution: {resolution}).")
             return None
             
-        data = {
-            'SnapshotTime': [p.get('snapshotTime') for p in prices],
-            'Open': [p.get('openPrice', {}).get('bid') for p in prices],
-            'High': [p.get('highPrice', {}).get('bid') for p in prices],
-            'Low': [p.get('lowPrice', {}).get('bid') for p in prices],
-            'Close': [p.get('closePrice', {}).get('bid') for p in prices],
-            'Volume': [p.get('lastTradedVolume') for p in prices]
-        }
-        df = pd.DataFrame(data)
+        df = pd.json_normalize(prices).reindex(columns=list(CAPITAL_BAR_COLUMNS)).rename(columns=CAPITAL_BAR_COLUMNS)
         df['SnapshotTime'] = pd.to_datetime(df['SnapshotTime'], errors='coerce', utc=True)
         df.dropna(subset=['SnapshotTime', 'Close', 'Open', 'High', 'Low', 'Volume'], inplace=True)
+        # Compact dtypes; the VWAP reduction widens back to float64 itself
+        df = df.astype({'Open': np.float32, 'High': np.float32, 'Low': np.float32, 'Close': np.float32, 'Volume': np.uint32})
         
         if df.empty:
             logger.log(f"   ...Price bars for {epic} were empty after cleaning.")
             return None
         
-        # Filter to *today's* pre-market (4:00 - 9:30 ET)
-        df['ET_Time'] = df['SnapshotTime'].dt.tz_convert(US_EASTERN)
-        today_et = datetime.now(US_EASTERN).date()
-        pm_start = US_EASTERN.localize(datetime(today_et.year, today_et.month, today_et.day, PREMARKET_START_HOUR, 0))
-        pm_end = US_EASTERN.localize(datetime(today_et.year, today_et.month, today_et.day, PREMARKET_END_HOUR, PREMARKET_END_MINUTE))
-        
-        df_premarket = df[(df['ET_Time'] >= pm_start) & (df['ET_Time'] < pm_end)].copy()
+        # Filter to *today's* pre-market by comparing the UTC index against the precomputed window
+        df = df.set_index('SnapshotTime')
+        df_premarket = df[(df.index >= pm_start_utc) & (df.index < pm_end_utc)]
         
         if df_premarket.empty:
-            logger.log(f"   ...No bars found for {epic} within today's pre-market window ({pm_start.strftime('%Y-%m-%d %H:%M')} to {pm_end.strftime('%H:%M')}).")
+            logger.log(f"   ...No bars found for {epic} within today's pre-market window ({pm_start_utc.strftime('%Y-%m-%d %H:%M')} to {pm_end_utc.strftime('%H:%M')} UTC).")
             return pd.DataFrame() # Return EMPTY dataframe instead of None
             
         logger.log(f"   ...Successfully extracted {len(df_premarket)} pre-market bars for {epic}.")
@@ -773,58 +1098,91 @@ def get_capital_price_bars(epic: str, cst: str, xst: str, resolution: str, logge
         return None
 
 # --- NEW: Pre-Market Processor ---
-def process_premarket_bars_to_summary(ticker: str, df_pm: pd.DataFrame, live_price: float, logger: AppLogger) -> str:
+def expand_value_area(vol_hist: np.ndarray, poc_bin_index: int, target_volume: float) -> tuple[int, int]:
+    """
+    Grows the value area outward from the POC bin, taking the heavier neighbouring bin
+    each step, until it holds `target_volume`. Returns the (low, high) bin indices.
+    """
+    # Plain Python floats: scalar indexing into a list is much cheaper than into an ndarray
+    volumes = vol_hist.tolist()
+    last_bin_index = len(volumes) - 1
+    current_volume = volumes[poc_bin_index]
+    val_bin_index, vah_bin_index = poc_bin_index, poc_bin_index
+
+    while current_volume < target_volume and (val_bin_index > 0 or vah_bin_index < last_bin_index):
+        vol_up = volumes[vah_bin_index + 1] if vah_bin_index < last_bin_index else 0
+        vol_down = volumes[val_bin_index - 1] if val_bin_index > 0 else 0
+        if vol_up == 0 and vol_down == 0: break
+        if vol_up > vol_down:
+            current_volume += vol_up; vah_bin_index += 1
+        else:
+            current_volume += vol_down; val_bin_index -= 1
+
+    return val_bin_index, vah_bin_index
+
+def calculate_premarket_volume_profile(closes: np.ndarray, volumes: np.ndarray, total_volume: float) -> tuple[float, float, float] | None:
+    """
+    Builds a close-price volume profile (up to 20 bins) for the pre-market bars and
+    expands from the POC bin until it holds 70% of volume.
+    Returns (poc, val, vah), or None if no profile could be built.
+    """
+    unique_prices = np.unique(closes).size
+    bins_calc = min(20, unique_prices - 1 if unique_prices > 1 else 1)
+    if bins_calc <= 0:
+        return None
+
+    # pd.cut's binning on plain arrays instead of a categorical + groupby: equal-width
+    # right-closed (a, b] bins, with the lowest edge pulled down 0.1% of the range so the
+    # minimum close lands in the first bin (or the range padded by 0.1% if it is flat)
+    low, high = closes.min(), closes.max()
+    if high == low:
+        pad = 0.001 * abs(low) if low != 0 else 0.001
+        edges = np.linspace(low - pad, high + pad, bins_calc + 1)
+    else:
+        edges = np.linspace(low, high, bins_calc + 1)
+        edges[0] -= (high - low) * 0.001
+    bin_indices = np.clip(np.searchsorted(edges, closes, side='left') - 1, 0, bins_calc - 1)
+    vol_hist = np.bincount(bin_indices, weights=volumes, minlength=bins_calc)
+    poc_bin_index = int(vol_hist.argmax())
+    pm_poc = (edges[poc_bin_index] + edges[poc_bin_index + 1]) / 2
+    pm_val_bin_index, pm_vah_bin_index = expand_value_area(vol_hist, poc_bin_index, total_volume * 0.7)
+    return float(pm_poc), float(edges[pm_val_bin_index]), float(edges[pm_vah_bin_index + 1])
+
+def process_premarket_bars_to_summary(ticker: str, df_pm: pd.DataFrame, live_price: float, logger: AppLogger, today_iso: str | None = None) -> str:
     """
     Analyzes the 5-min pre-market DataFrame and creates a detailed text summary
     in the same format as the EOD Processor.
+    Batch callers can pass `today_iso` so the date is formatted once per run.
     """
+    today_iso = today_iso or date.today().isoformat()
     logger.log(f"   ...Processing {len(df_pm)} pre-market bars for {ticker}...")
     try:
         if df_pm.empty:
-            return f"Pre-Market Story: {ticker} | {date.today().isoformat()} (No pre-market bars found. Current price is ${live_price:.2f})"
+            return f"Pre-Market Story: {ticker} | {today_iso} (No pre-market bars found. Current price is ${live_price:.2f})"
 
-        pm_open = df_pm['Open'].iloc[0]
-        pm_high = df_pm['High'].max()
-        pm_low = df_pm['Low'].min()
+        # One float64 matrix for all reductions instead of a pandas dispatch per column
+        bars = df_pm[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+        closes = bars[:, 3]
+        volumes = bars[:, 4]
+
+        pm_open = bars[0, 0]
+        pm_high = bars[:, 1].max()
+        pm_low = bars[:, 2].min()
         pm_close = live_price # Use the live price as the "current close"
-        total_volume = df_pm['Volume'].sum()
+        total_volume = int(volumes.sum())
         
         if total_volume > 0:
-            pm_vwap = (df_pm['Close'] * df_pm['Volume']).sum() / total_volume
+            pm_vwap = np.dot(closes, volumes) / total_volume
         else:
             pm_vwap = pm_close
         
         pm_poc = pm_close; pm_val = pm_low; pm_vah = pm_high
         
-        if not df_pm.empty and total_volume > 0 and len(df_pm) > 1:
+        if total_volume > 0 and closes.size > 1:
             try:
-                unique_prices = df_pm['Close'].nunique()
-                bins_calc = min(20, unique_prices - 1 if unique_prices > 1 else 1)
-                
-                if bins_calc > 0:
-                    price_bins = pd.cut(df_pm['Close'], bins=bins_calc)
-                    volume_by_price = df_pm.groupby(price_bins)['Volume'].sum()
-                    if not volume_by_price.empty:
-                        poc_range = volume_by_price.idxmax()
-                        pm_poc = poc_range.mid
-                        target_volume = total_volume * 0.7
-                        poc_bin_index = volume_by_price.index.get_loc(poc_range)
-                        current_volume = volume_by_price.iloc[poc_bin_index]
-                        pm_val_bin_index, pm_vah_bin_index = poc_bin_index, poc_bin_index
-
-                        while current_volume < target_volume and (pm_val_bin_index > 0 or pm_vah_bin_index < len(volume_by_price) - 1):
-                            next_up_index = pm_vah_bin_index + 1
-                            next_down_index = pm_val_bin_index - 1
-                            vol_up = volume_by_price.iloc[next_up_index] if next_up_index < len(volume_by_price) else 0
-                            vol_down = volume_by_price.iloc[next_down_index] if next_down_index >= 0 else 0
-                            if vol_up == 0 and vol_down == 0: break
-                            if vol_up > vol_down:
-                                current_volume += vol_up; pm_vah_bin_index = next_up_index
-                            else:
-                                current_volume += vol_down; pm_val_bin_index = next_down_index
-                        
-                        pm_val = volume_by_price.index[pm_val_bin_index].left
-                        pm_vah = volume_by_price.index[pm_vah_bin_index].right
+                profile = calculate_premarket_volume_profile(closes, volumes, total_volume)
+                if profile is not None:
+                    pm_poc, pm_val, pm_vah = profile
             except Exception as e:
                  logger.log(f"      ...Warn: Could not calculate POC/VAH for {ticker}: {e}")
         
@@ -835,26 +1193,41 @@ def process_premarket_bars_to_summary(ticker: str, df_pm: pd.DataFrame, live_pri
             if percent_of_range > 0.7: trend_desc = "Trending higher near PMH."
             elif percent_of_range < 0.3: trend_desc = "Trending lower near PML."
         
-        summary_text = f"""
-        Pre-Market Story: {ticker} | {date.today().isoformat()}
-        Open (PM): ${pm_open:.2f}
-        High (PMH): ${pm_high:.2f}
-        Low (PML): ${pm_low:.2f}
-        Current Price: ${pm_close:.2f}
-        Session VWAP (PM): ${pm_vwap:.2f}
-        Value Area (PM): ${pm_val:.2f} - ${pm_vah:.2f}
-        Point of Control (POC) (PM): ${pm_poc:.2f}
-        Total Volume (PM): {total_volume}
-        Key Action: Price opened PM at ${pm_open:.2f}, set a range between ${pm_low:.2f} and ${pm_high:.2f}. {trend_desc} Currently trading at ${pm_close:.2f} ({'above' if pm_close > pm_vwap else 'below'} PM VWAP).
-        """
-        return re.sub(r'\s+', ' ', summary_text).strip()
+        summary_parts = [
+            f"Pre-Market Story: {ticker} | {today_iso}",
+            f"Open (PM): ${pm_open:.2f}",
+            f"High (PMH): ${pm_high:.2f}",
+            f"Low (PML): ${pm_low:.2f}",
+            f"Current Price: ${pm_close:.2f}",
+            f"Session VWAP (PM): ${pm_vwap:.2f}",
+            f"Value Area (PM): ${pm_val:.2f} - ${pm_vah:.2f}",
+            f"Point of Control (POC) (PM): ${pm_poc:.2f}",
+            f"Total Volume (PM): {total_volume}",
+            f"Key Action: Price opened PM at ${pm_open:.2f}, set a range between ${pm_low:.2f} and ${pm_high:.2f}. {trend_desc} Currently trading at ${pm_close:.2f} ({'above' if pm_close > pm_vwap else 'below'} PM VWAP).",
+        ]
+        return " ".join(summary_parts)
     
     except Exception as e:
         logger.log(f"   ...Error in process_premarket_bars_to_summary for {ticker}: {e}")
-        return f"Pre-Market Summary: {ticker} | {date.today().isoformat()} (Live Price: ${live_price:.2f}. Error processing bars.)"
+        return f"Pre-Market Summary: {ticker} | {today_iso} (Live Price: ${live_price:.2f}. Error processing bars.)"
 
 
             
+def carry_forward_eod_card(eod_card_json_str: str, live_price: float, overnight_news: str) -> dict:
+    """
+    Tactical card for a ticker with no pre-market bars: yesterday's EOD card plus the
+    live price context, so there is no AI call for a ticker with no pre-market action.
+    """
+    card = json_loads(eod_card_json_str)
+    # json_valid() in SQL admits any JSON value; only an object is a card
+    if not isinstance(card, dict): raise ValueError(f"EOD card is a JSON {type(card).__name__}, not an object")
+    premarket_context = card.get('preMarketContext')
+    if not isinstance(premarket_context, dict): premarket_context = card['preMarketContext'] = {}
+    premarket_context['livePrice'] = f"~${live_price:.2f}"
+    premarket_context['overnightNews'] = overnight_news or "N/A"
+    premarket_context['tacticalSummary'] = f"No pre-market trading; EOD plan carried forward. | Briefing: {card.get('screener_briefing', 'N/A')}"
+    return card
+
 # --- Workflow 2a-Part2 - Generate Pre-Market Tactical Cards (UPDATED with Economy Card) ---
 def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: str, premarket_economy_card: dict, logger: AppLogger, cst: str, xst: str):
     logger.log("--- Starting Workflow 2a-Part2: Generate Pre-Market Company Cards ---")
@@ -864,43 +1237,34 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
     economy_card_text = "Not available."
     if premarket_economy_card:
         try:
-            economy_card_text = json.dumps(premarket_economy_card, indent=2)
+            economy_card_text = json_dumps_pretty(premarket_economy_card)
             logger.log("   ...Pre-Market Economy Card context loaded.")
         except Exception as e:
             logger.log(f"   ...Warn: Could not serialize Pre-Market Economy Card: {e}")
             economy_card_text = str(premarket_economy_card)
 
     try:
-        conn = sqlite3.connect(DATABASE_FILE); conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-        
         logger.log(f"Fetching EOD cards for {len(selected_tickers)} selected tickers...")
         placeholders = ','.join('?' * len(selected_tickers))
-        cursor.execute(f"SELECT ticker, historical_level_notes, company_overview_card_json FROM stocks WHERE ticker IN ({placeholders}) AND company_overview_card_json IS NOT NULL AND company_overview_card_json != '' AND json_valid(company_overview_card_json)", selected_tickers)
-        eod_card_rows = cursor.fetchall()
+        # Read-only pool: this workflow never writes, so it can't contend with the EOD writer
+        with get_read_pool().acquire() as conn:
+            eod_card_rows = conn.execute(f"SELECT ticker, historical_level_notes, company_overview_card_json, json_extract(company_overview_card_json, '$.basicContext.priceTrend') AS price_trend FROM stocks WHERE ticker IN ({placeholders}) AND company_overview_card_json IS NOT NULL AND company_overview_card_json != '' AND json_valid(company_overview_card_json)", selected_tickers).fetchall()
         
-        eod_cards_map = {row['ticker']: (row['historical_level_notes'] or "", row['company_overview_card_json']) for row in eod_card_rows}
+        # json_valid() above already vetted each card and SQLite pulled priceTrend for the gap, so the
+        # stored card text goes into the prompt as-is: {ticker: (historical_notes, card_json_str, price_trend)}
+        eod_cards = {row['ticker']: (row['historical_level_notes'] or "", row['company_overview_card_json'], row['price_trend']) for row in eod_card_rows}
         
-        if len(eod_card_rows) != len(selected_tickers):
-             found_tickers = eod_cards_map.keys()
-             missing = [t for t in selected_tickers if t not in found_tickers]
+        if len(eod_cards) != len(selected_tickers):
+             missing = [t for t in selected_tickers if t not in eod_cards]
              logger.log(f"Warn: No valid EOD cards for: {', '.join(missing)}.")
-             if not eod_card_rows: logger.log("Error: No EOD cards found."); return False
+             if not eod_cards: logger.log("Error: No EOD cards found."); return False
         
         logger.log("Fetching Capital.com data (Live Price & 5-min Bars)...")
-        live_prices = {}
-        bar_dataframes = {}
-        
-        for i, ticker in enumerate(selected_tickers):
-             if ticker in eod_cards_map:
-                 bid, offer = get_capital_current_price(ticker, cst, xst, logger)
-                 if bid and offer:
-                     live_prices[ticker] = (bid + offer) / 2
-                 
-                 df_5m = get_capital_price_bars(ticker, cst, xst, "MINUTE_5", logger) # Use 5-min bars
-                 if df_5m is not None: # Can be empty DF, that's fine
-                     bar_dataframes[ticker] = df_5m
-                 
-                 if i < len(selected_tickers) - 1: time.sleep(0.33)
+        card_tickers = [t for t in selected_tickers if t in eod_cards]
+        live_prices, bar_dataframes = fetch_premarket_market_data(card_tickers, cst, xst, logger)
+        # Prices are snapshotted once above, so one timestamp/date serves every ticker in this run
+        time_str = datetime.now(US_EASTERN).strftime('%Y-%m-%d %H:%M:%S %Z')
+        today_iso = date.today().isoformat()
 
         logger.log(f"   ...Live prices found for {len(live_prices)} / {len(selected_tickers)} tickers.")
         logger.log(f"   ...5-min bars found for {len(bar_dataframes)} / {len(selected_tickers)} tickers.")
@@ -910,16 +1274,10 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
         )
 
         processed_count = 0
-        logger.log(f"Starting AI synthesis loop for {len(eod_card_rows)} tickers with EOD cards...")
-        for i, row in enumerate(eod_card_rows):
-            ticker = row['ticker']
+        logger.log(f"Starting AI synthesis loop for {len(eod_cards)} tickers with EOD cards...")
+        for ticker, (historical_notes_pm, eod_card_json_str, price_trend) in eod_cards.items():
             logger.log(f"\n--- Processing Ticker: {ticker} ---")
-            historical_notes_pm = row['historical_level_notes'] or ""
-            eod_card_json_str = row['company_overview_card_json']
-            try:
-                eod_card_dict = json.loads(eod_card_json_str)
-                logger.log("**Base EOD Card (Input):**"); logger.log_code(eod_card_dict)
-            except Exception as e: logger.log(f"   ...Skip {ticker}: Invalid EOD JSON. Err: {e}"); continue
+            logger.log("**Base EOD Card (Input):**"); logger.log_code(eod_card_json_str)
 
             live_price = live_prices.get(ticker)
             df_pm = bar_dataframes.get(ticker)
@@ -929,17 +1287,23 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
                  logger.log(f"      (Live Price found: {bool(live_price)}, Bar Data fetch status: {'Success (May be Empty)' if isinstance(df_pm, pd.DataFrame) else 'Failed (None)'})")
                  continue
 
+            if df_pm.empty:
+                 logger.log(f"   ...No pre-market bars for {ticker}. Carrying the EOD card forward without an AI call.")
+                 try:
+                     premarket_cards_output[ticker] = carry_forward_eod_card(eod_card_json_str, live_price, overnight_news)
+                     processed_count += 1
+                 except ValueError as e: logger.log(f"      ...Error {ticker}: Could not parse EOD card. Error: {e}")
+                 continue
+
             logger.log(f"**Processing {len(df_pm)} 5-min bars for Pre-Market Story...**")
-            pre_market_story_text = process_premarket_bars_to_summary(ticker, df_pm, live_price, logger)
+            pre_market_story_text = process_premarket_bars_to_summary(ticker, df_pm, live_price, logger, today_iso)
             logger.log("**Generated Pre-Market Story (Input):**")
             logger.log_code(pre_market_story_text, 'text')
             
             live_price_for_prompt = f"~${live_price:.2f}"
-            time_str = datetime.now(US_EASTERN).strftime('%Y-%m-%d %H:%M:%S %Z')
             pre_market_context_str = f"Current Price: {live_price_for_prompt} (@ {time_str})."
             try:
-                 basic_context=eod_card_dict.get("basicContext",{}); price_trend=basic_context.get("priceTrend","")
-                 y_close_str = str(price_trend).split("|")[0].replace("~","").replace("$","").strip()
+                 y_close_str = str(price_trend or "").split("|")[0].replace("~","").replace("$","").strip()
                  if y_close_str: y_close=float(y_close_str); gap_pct=((live_price-y_close)/y_close)*100; pre_market_context_str += f" Gap: {gap_pct:+.2f}%."
             except Exception as e: logger.log(f"      ...Warn: Error calculating gap: {e}")
             logger.log(f"**Live Price / Gap String (Input):** `{pre_market_context_str}`")
@@ -954,7 +1318,7 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
                 {historical_notes_pm}
 
             3.  **Yesterday's EOD Company Card for {ticker} (Base Strategy):**
-                {json.dumps(eod_card_dict, indent=2)}
+                {eod_card_json_str}
 
             [LIVE DATA]
             - **Live Price/Gap:** {pre_market_context_str}
@@ -962,7 +1326,7 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
             - **Company-Specific News:** {overnight_news or "N/A"}
 
             [TASK]
-            Generate the NEW "Pre-Market Tactical Card" JSON for {ticker} for the open ({date.today().isoformat()}).
+            Generate the NEW "Pre-Market Tactical Card" JSON for {ticker} for the open ({today_iso}).
             Your analysis MUST consider the Pre-Market Economy Card. For example, if the macro view is risk-off, be more skeptical of bullish breakouts.
 
             **CRITICAL INSTRUCTIONS:**
@@ -974,15 +1338,16 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
             """
             logger.log("**Full Prompt Sent to Pre-Market AI:**"); logger.log_code(prompt, language='text')
 
-            key_to_use = random.choice(API_KEYS)
-            logger.log(f"Calling Pre-Market AI (key #{API_KEYS.index(key_to_use)+1})...")
+            key_to_use = next_api_key()
+            logger.log(f"Calling Pre-Market AI (key #{API_KEY_INDEX[key_to_use]+1})...")
+            get_gemini_rate_limiter().acquire() # Only waits if the previous calls came back faster than the pacing rate
             ai_response_text = call_gemini_api(prompt, key_to_use, pre_market_synthesizer_system_prompt, logger)
 
             if ai_response_text:
                 logger.log("**Raw AI Response (Pre-Market):**"); logger.log_code(ai_response_text, language='text')
-                json_match = re.search(r"```json\s*([\s\S]+?)\s*```", ai_response_text); ai_response_text = json_match.group(1) if json_match else ai_response_text.strip()
+                ai_response_text = strip_json_fence(ai_response_text)
                 try:
-                    premarket_card_dict = json.loads(ai_response_text)
+                    premarket_card_dict = json_loads(ai_response_text)
                     logger.log("**Parsed AI Response (Tactical Card):**"); logger.log_code(premarket_card_dict)
                     
                     if 'preMarketContext' not in premarket_card_dict: premarket_card_dict['preMarketContext'] = {}
@@ -1013,15 +1378,12 @@ def generate_premarket_tactical_cards(selected_tickers: list, overnight_news: st
                     logger.log(f"      ...Error {ticker}: AI response not valid JSON. Error: {e}")
             else:
                  logger.log(f"      ...Error {ticker}: No response from Pre-Market AI.")
-            if i < len(eod_card_rows) - 1: time.sleep(0.75)
 
         st.session_state['premarket_cards'] = premarket_cards_output
-        logger.log(f"--- Workflow 2a-Part2 Complete: Generated pre-market cards for {processed_count}/{len(eod_card_rows)} tickers ---")
+        logger.log(f"--- Workflow 2a-Part2 Complete: Generated pre-market cards for {processed_count}/{len(eod_cards)} tickers ---")
         return True
 
     except Exception as e: logger.log(f"Unexpected error in generate_premarket_cards: {e}"); st.session_state['premarket_cards'] = {}; return False
-    finally:
-        if conn: conn.close()
 
 
 def run_tactical_screener(market_condition: str, pre_market_cards: dict, economy_card: dict, api_key_to_use: str, logger: AppLogger) -> str:
@@ -1037,7 +1399,7 @@ def run_tactical_screener(market_condition: str, pre_market_cards: dict, economy
     economy_card_text = "Not available."
     if economy_card:
         try:
-            economy_card_text = json.dumps(economy_card, indent=2)
+            economy_card_text = json_dumps_pretty(economy_card)
         except Exception as e:
             logger.log(f"Warning: Could not serialize Economy Card for screener: {e}")
             economy_card_text = str(economy_card)
@@ -1046,19 +1408,22 @@ def run_tactical_screener(market_condition: str, pre_market_cards: dict, economy
     candidate_summaries = []
     for ticker, card in pre_market_cards.items():
         if not isinstance(card, dict): continue
+        # Look each nested section up once rather than per field
+        opening_plan = card.get('openingTradePlan', {})
+        premarket_context = card.get('preMarketContext', {})
         
         summary = f"""
         ---
         Ticker: {ticker}
         Confidence: {card.get('confidence', 'N/A')}
-        Live Price: {card.get('preMarketContext', {}).get('livePrice', 'N/A')}
+        Live Price: {premarket_context.get('livePrice', 'N/A')}
         Screener Briefing: {card.get('screener_briefing', 'N/A')}
-        Primary Plan: {card.get('openingTradePlan', {}).get('planName', 'N/A')}
-        Trigger: {card.get('openingTradePlan', {}).get('trigger', 'N/A')}
-        Invalidation: {card.get('openingTradePlan', {}).get('invalidation', 'N/A')}
+        Primary Plan: {opening_plan.get('planName', 'N/A')}
+        Trigger: {opening_plan.get('trigger', 'N/A')}
+        Invalidation: {opening_plan.get('invalidation', 'N/A')}
         ---
         """
-        candidate_summaries.append(re.sub(r'\s+', ' ', summary).strip())
+        candidate_summaries.append(WHITESPACE_PATTERN.sub(' ', summary).strip())
     
     all_candidates_text = "\n".join(candidate_summaries)
     logger.log(f"Prepared {len(candidate_summaries)} candidate summaries for the AI.")
@@ -1133,14 +1498,64 @@ else:
 
 
 # --- Helper Functions (Unchanged) ---
+@st.cache_resource
+def get_read_pool() -> ReadPool:
+    """
+    Process-wide pool of read-only connections for UI and workflow reads (ticker list,
+    viewer card, proximity scan, tactical-card inputs), kept apart from the writer.
+    """
+    return ReadPool()
+
+@st.cache_data(ttl=30, show_spinner=False)
 def get_all_tickers_from_db():
     if not os.path.exists(DATABASE_FILE): return []
-    conn=None; tickers=[]
-    try: conn=sqlite3.connect(DATABASE_FILE); tickers=pd.read_sql_query("SELECT DISTINCT ticker FROM stocks ORDER BY ticker ASC",conn)['ticker'].tolist()
-    except Exception as e: st.error(f"Err fetch tickers:{e}")
-    finally:
-        if conn: conn.close()
-    return tickers
+    try:
+        with get_read_pool().acquire() as conn: return [row[0] for row in conn.execute("SELECT DISTINCT ticker FROM stocks ORDER BY ticker ASC")]
+    except Exception as e: st.error(f"Err fetch tickers:{e}"); return []
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_eod_card_texts(tickers: tuple) -> dict:
+    """
+    Fetches the stored EOD card JSON text and last_updated for every ticker in one IN (...)
+    query, so switching tickers in the viewer is a dict lookup rather than a DB round trip.
+    Pass a sorted tuple so equal ticker sets share one cache entry.
+    """
+    if not tickers: return {}
+    placeholders = ','.join('?' * len(tickers))
+    with get_read_pool().acquire() as conn:
+        rows = conn.execute(f"SELECT ticker, company_overview_card_json, last_updated FROM stocks WHERE ticker IN ({placeholders})", tickers).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_eod_card(ticker: str, last_updated: str, card_fingerprint: tuple, _card_text: str) -> dict:
+    """
+    Parses a stored EOD card once per version. The card text itself is excluded from the
+    cache key (leading underscore); `card_fingerprint` (see card_fingerprint()) stands in for
+    it, so a same-day rewrite gets a fresh parse without hashing the whole document here.
+    """
+    return json_loads(_card_text)
+
+def card_fingerprint(card_text: str) -> tuple:
+    """Cheap content key for load_eod_card: (length, hash()), one C-level pass over the text."""
+    return (len(card_text), hash(card_text))
+
+# (label, key path) for the viewer's "Key Data for Screener" list; paths are split once here
+VIEWER_SCREENER_FIELDS = tuple((name, tuple(path.split('.'))) for name, path in {
+    "Confidence":'confidence',"Briefing":'screener_briefing',
+    "Open Plan":'openingTradePlan.planName',"Alt Plan":'alternativePlan.planName',
+    "Action":'technicalStructure.keyAction',"Support":'technicalStructure.majorSupport',
+    "Resistance":'technicalStructure.majorResistance',"Live Price":'preMarketContext.livePrice',
+    "PM Summary":'preMarketContext.tacticalSummary'
+}.items())
+
+def get_card_field(card, keys, default="N/A"):
+    """Walks a pre-split key path through nested card dicts; lists are space-joined."""
+    value = card
+    for key in keys:
+        if not isinstance(value, dict): return default
+        value = value.get(key)
+    if isinstance(value, list): return " ".join(map(str, value)) or default
+    return str(value) if value is not None else default
 
 def extract_json_field(json_string, field_path, default="N/A"):
     if not json_string or pd.isna(json_string): return default
@@ -1196,7 +1611,8 @@ with tab_runner_eod:
 
         if st.button("▶️ Run Stock Processor", use_container_width=True, help="Runs the processor for all stocks and populates the text area below."):
             with st.spinner("Running stock processor... This may take a few minutes."):
-                analysis_date = datetime.now(US_EASTERN).date() - timedelta(days=1)
+                from pages.processor import generate_analysis_text
+                analysis_date = previous_trading_day()
                 output = generate_analysis_text(STOCK_TICKERS, analysis_date)
                 st.session_state.eod_raw_stocks = output
             st.rerun()
@@ -1226,21 +1642,30 @@ with tab_runner_eod:
                     logs_stocks = st.expander("Stock Update Logs", True)
                     logger_stocks = AppLogger(logs_stocks)
                     t_start = time.time()
-                    for i, s in enumerate(processed):
-                        key = random.choice(API_KEYS)
-                        ticker = parse_raw_summary(s).get('ticker')
-                        if not ticker:
-                            logger_stocks.log(f"SKIP: Could not parse ticker from summary: {s[:100]}...")
-                            continue
+                    # Parse on the script thread; workers only get summaries with a ticker
+                    jobs = []
+                    for s in processed:
+                        ticker = parse_raw_summary_cached(s).get('ticker')
+                        if ticker: jobs.append((ticker, s))
+                        else: logger_stocks.log(f"SKIP: Could not parse ticker from summary: {s[:100]}...")
+                    # One worker per API key; each Gemini call borrows a free key from the pool
+                    key_pool = GeminiKeyPool(API_KEYS)
+
+                    def run_stock_update(ticker, s):
+                        buffer = BufferedLogger()
                         try:
-                            update_stock_note(ticker, s, macro_context_input, key, logger_stocks)
+                            update_stock_note(ticker, s, macro_context_input, None, buffer, key_pool=key_pool)
                         except Exception as e:
-                            logger_stocks.log(f"!!! EOD ERROR for {ticker}: {e}")
-                        if i < len(processed) - 1:
-                            logger_stocks.log("   ...waiting 1s...")
-                            time.sleep(1)
+                            buffer.log(f"!!! EOD ERROR for {ticker}: {e}")
+                        return buffer
+
+                    with script_thread_pool(max(1, len(API_KEYS))) as executor:
+                        futures = [executor.submit(run_stock_update, ticker, s) for ticker, s in jobs]
+                        for future in as_completed(futures):
+                            future.result().flush_to(logger_stocks)
                     t_end = time.time()
                     logger_stocks.log(f"--- Stock EOD Updates Done (Total Time: {t_end - t_start:.2f}s) ---")
+                    get_all_tickers_from_db.clear(); get_eod_card_texts.clear(); load_eod_card.clear() # EOD updates add tickers and rewrite cards
                     st.info("Stock updates complete.")
 
     # --- Column 2: Global Economy Card Update ---
@@ -1250,7 +1675,8 @@ with tab_runner_eod:
         
         if st.button("▶️ Run ETF Processor", use_container_width=True, help="Runs the processor for all ETFs and populates the text area below."):
             with st.spinner("Running ETF processor... This may take a few minutes."):
-                analysis_date = datetime.now(US_EASTERN).date() - timedelta(days=1)
+                from pages.processor import generate_analysis_text
+                analysis_date = previous_trading_day()
                 output = generate_analysis_text(ETF_TICKERS, analysis_date)
                 st.session_state.eod_raw_etfs = output
             st.rerun()
@@ -1267,7 +1693,7 @@ with tab_runner_eod:
             else:
                 logs_economy = st.expander("Economy Card Update Logs", True)
                 logger_economy = AppLogger(logs_economy)
-                key_eco = random.choice(API_KEYS)
+                key_eco = next_api_key()
                 with st.spinner("Updating Economy Card..."):
                     try:
                         update_economy_card(manual_macro_summary, st.session_state.eod_raw_etfs, key_eco, logger_economy)
@@ -1289,12 +1715,10 @@ with tab_editor:
     st.subheader("Global Economy Card")
     st.caption("This is the single, global context card for the entire market.")
     
-    conn_eco = None
+    conn_eco = get_db_connection(); db_lock = get_db_lock()
     try:
-        conn_eco = sqlite3.connect(DATABASE_FILE)
-        cursor_eco = conn_eco.cursor()
-        cursor_eco.execute("SELECT economy_card_json FROM market_context WHERE context_id = 1")
-        eco_data_row = cursor_eco.fetchone()
+        with db_lock:
+            eco_data_row = conn_eco.execute(SELECT_ECONOMY_CARD_SQL).fetchone()
         
         card_json_str = DEFAULT_ECONOMY_CARD_JSON
         if eco_data_row and eco_data_row[0]:
@@ -1310,9 +1734,9 @@ with tab_editor:
             edited_data = display_editable_economy_card(economy_card_data)
             if st.button("💾 Save Economy Card Changes", use_container_width=True, key="save_eco_card"):
                 try:
-                    new_card_json = json.dumps(edited_data, indent=2)
-                    cursor_eco.execute("UPDATE market_context SET economy_card_json = ?, last_updated = ? WHERE context_id = 1", (new_card_json, date.today().isoformat()))
-                    conn_eco.commit()
+                    new_card_json = json_dumps_pretty(edited_data)
+                    with db_lock, conn_eco:
+                        conn_eco.execute(UPDATE_ECONOMY_CARD_SQL, (new_card_json, date.today().isoformat()))
                     st.success("Global Economy Card saved!")
                     st.session_state.edit_mode_economy = False
                     st.rerun()
@@ -1323,9 +1747,6 @@ with tab_editor:
 
     except sqlite3.Error as e:
         st.error(f"Database error loading economy card: {e}")
-    finally:
-        if conn_eco:
-            conn_eco.close()
 
     # --- Individual Stock Cards ---
     st.markdown("---")
@@ -1365,12 +1786,10 @@ with tab_editor:
             # --- END NEW ---
 
             # The rest of the logic uses the selected_ticker from the selectbox
-            conn_stock = None
+            conn_stock = get_db_connection(); db_lock = get_db_lock()
             try:
-                conn_stock = sqlite3.connect(DATABASE_FILE)
-                cursor_stock = conn_stock.cursor()
-                cursor_stock.execute("SELECT historical_level_notes, company_overview_card_json FROM stocks WHERE ticker = ?", (selected_ticker,))
-                stock_data = cursor_stock.fetchone()
+                with db_lock:
+                    stock_data = conn_stock.execute(SELECT_STOCK_NOTES_SQL, (selected_ticker,)).fetchone()
 
                 notes = stock_data[0] if stock_data else ""
                 card_json = stock_data[1] if stock_data and stock_data[1] else DEFAULT_COMPANY_OVERVIEW_JSON.replace("TICKER", selected_ticker)
@@ -1378,10 +1797,10 @@ with tab_editor:
                 with st.form("historical_notes_form"):
                     new_notes = st.text_area("Historical Level Notes (Major Levels)", value=notes, height=150)
                     if st.form_submit_button("Save Historical Notes", use_container_width=True):
-                        cursor_stock.execute("UPDATE stocks SET historical_level_notes = ? WHERE ticker = ?", (new_notes, selected_ticker))
-                        if cursor_stock.rowcount == 0:
-                             cursor_stock.execute("INSERT INTO stocks (ticker, historical_level_notes) VALUES (?, ?)", (selected_ticker, new_notes))
-                        conn_stock.commit()
+                        with db_lock, conn_stock:
+                            if conn_stock.execute("UPDATE stocks SET historical_level_notes = ? WHERE ticker = ?", (new_notes, selected_ticker)).rowcount == 0:
+                                conn_stock.execute("INSERT INTO stocks (ticker, historical_level_notes) VALUES (?, ?)", (selected_ticker, new_notes))
+                        get_all_tickers_from_db.clear() # The save may have inserted a new ticker
                         st.success(f"Historical notes for {selected_ticker} saved!")
                         st.rerun()
 
@@ -1426,9 +1845,6 @@ with tab_editor:
 
             except sqlite3.Error as e:
                 st.error(f"Database error for {selected_ticker}: {e}")
-            finally:
-                if conn_stock:
-                    conn_stock.close()
 
 
 # --- TAB 3: Pre-Flight Check (Workflow 2a) (RESTRUCTURED) ---
@@ -1477,38 +1893,40 @@ with tab_preflight:
     proximity_pct = st.slider("Proximity Filter (%)", 0.1, 10.0, 2.5, 0.1, help="Filter for stocks trading within this % distance of a major S/R level.")
     if st.button("Scan All Tickers for Proximity", use_container_width=True):
         with st.spinner("Scanning all tickers..."):
-            conn = sqlite3.connect(DATABASE_FILE)
-            all_eod_cards = pd.read_sql_query("SELECT ticker, company_overview_card_json FROM stocks WHERE company_overview_card_json IS NOT NULL", conn)
-            conn.close()
+            # Let SQLite's JSON1 pull just the two level fields instead of parsing every card in Python
+            with get_read_pool().acquire() as conn:
+                level_rows = conn.execute(PROXIMITY_LEVELS_SQL).fetchall()
             
-            scan_results = []
-            for _, row in all_eod_cards.iterrows():
-                ticker, card_json = row['ticker'], row['company_overview_card_json']
-                try:
-                    card = json.loads(card_json)
-                    support_str = str(card.get('technicalStructure', {}).get('majorSupport', ''))
-                    resist_str = str(card.get('technicalStructure', {}).get('majorResistance', ''))
-                    s_match, r_match = re.search(r'(\d+\.?\d*)', support_str), re.search(r'(\d+\.?\d*)', resist_str)
-                    if not (s_match and r_match): continue
-                    support, resistance = float(s_match.group(1)), float(r_match.group(1))
-                    
-                    bid, offer = get_capital_current_price(ticker, st.session_state.capital_session["cst"], st.session_state.capital_session["xst"], logger_pf)
-                    if not bid: continue
-                    live_price = (bid + offer) / 2
-                    
-                    prox_pct = (min(abs(live_price - support), abs(live_price - resistance)) / live_price) * 100
-                    if prox_pct <= proximity_pct:
-                        scan_results.append({"Ticker": ticker, "Proximity (%)": f"{prox_pct:.2f}", "Live Price": f"${live_price:.2f}", "Support": f"${support:.2f}", "Resistance": f"${resistance:.2f}"})
-                except Exception as e:
-                    logger_pf.log(f"Error scanning {ticker}: {e}")
-            
-            st.session_state.proximity_scan_results = sorted(scan_results, key=lambda x: float(x['Proximity (%)']))
+            levels = {}
+            for ticker, support, resistance in level_rows:
+                s_match, r_match = LEVEL_NUMBER_PATTERN.search(str(support)), LEVEL_NUMBER_PATTERN.search(str(resistance))
+                if not (s_match and r_match): continue
+                levels[ticker] = (float(s_match.group(1)), float(r_match.group(1)))
+
+            # Price lookups are independent network calls, so fetch them concurrently
+            live_prices = fetch_live_prices(list(levels), st.session_state.capital_session["cst"], st.session_state.capital_session["xst"], logger_pf)
+
+            # Compute proximity column-wise instead of one Python dict per ticker
+            scan_df = pd.DataFrame.from_dict(levels, orient='index', columns=['Support', 'Resistance'])
+            scan_df['Live Price'] = scan_df.index.map(live_prices).astype(float)
+            scan_df = scan_df[scan_df['Live Price'] > 0]
+            live = scan_df['Live Price']
+            nearest = np.minimum((live - scan_df['Support']).abs(), (live - scan_df['Resistance']).abs())
+            scan_df['Proximity (%)'] = nearest / live * 100
+            scan_df = scan_df[scan_df['Proximity (%)'] <= proximity_pct].sort_values('Proximity (%)')
+            scan_df = scan_df.rename_axis('Ticker').reset_index()[['Ticker', 'Proximity (%)', 'Live Price', 'Support', 'Resistance']]
+
+            st.session_state.proximity_scan_results = scan_df.to_dict('records')
             st.rerun()
 
     # Sub-step B: Manual Curation & Generation
     if st.session_state.proximity_scan_results:
         st.markdown("##### **Step 3b: Curate and Generate Cards**")
-        st.dataframe(pd.DataFrame(st.session_state.proximity_scan_results), use_container_width=True)
+        st.dataframe(
+            pd.DataFrame(st.session_state.proximity_scan_results),
+            use_container_width=True,
+            column_config=get_proximity_column_config()
+        )
         
         interesting_tickers = [res['Ticker'] for res in st.session_state.proximity_scan_results]
         
@@ -1548,16 +1966,14 @@ with tab_viewer:
             if sel_ticker_v:
                 col1_v, col2_v = st.columns(2)
                 with col1_v: # EOD Card
-                    st.subheader("EOD Card (DB)"); conn_eod=None
+                    st.subheader("EOD Card (DB)")
                     try:
-                        conn_eod=sqlite3.connect(DATABASE_FILE); cur=conn_eod.cursor(); cur.execute("SELECT company_overview_card_json FROM stocks WHERE ticker=?", (sel_ticker_v,)); row=cur.fetchone()
-                        if row and row[0]:
-                            try: st.json(json.loads(row[0]), expanded=False)
-                            except json.JSONDecodeError: st.error("Invalid EOD JSON."); st.code(row[0])
+                        card_text_v, card_updated_v = get_eod_card_texts(tuple(sorted(t for t in opts_v if t))).get(sel_ticker_v, (None, None))
+                        if card_text_v:
+                            try: st.json(load_eod_card(sel_ticker_v, card_updated_v, card_fingerprint(card_text_v), card_text_v), expanded=False)
+                            except ValueError: st.error("Invalid EOD JSON."); st.code(card_text_v)
                         else: st.warning("No EOD card.")
                     except sqlite3.Error as e: st.error(f"DB err EOD: {e}")
-                    finally:
-                        if conn_eod: conn_eod.close()
                 with col2_v: # Pre-Market Card
                     st.subheader("Pre-Market Card (Memory)");
                     if sel_ticker_v in st.session_state.get('premarket_cards',{}):
@@ -1567,23 +1983,8 @@ with tab_viewer:
                         else:
                              st.error("PM card data invalid."); st.code(str(pm_card_v))
                         st.markdown("---"); st.subheader("Key Data for Screener"); st.caption("(From Pre-Market Card)")
-                        def get_v_field(d,p,df="N/A"): # Local helper
-                            if not isinstance(d, dict): return df
-                            k=p.split('.'); v=d
-                            try:
-                                for key in k: v=v.get(key) if isinstance(v,dict) else None
-                                if isinstance(v,list): return " ".join(map(str,v)) or df
-                                return str(v) if v is not None else df
-                            except: return df
                         if isinstance(pm_card_v, dict):
-                            fields_v = {
-                                "Confidence":'confidence',"Briefing":'screener_briefing',
-                                "Open Plan":'openingTradePlan.planName',"Alt Plan":'alternativePlan.planName',
-                                "Action":'technicalStructure.keyAction',"Support":'technicalStructure.majorSupport',
-                                "Resistance":'technicalStructure.majorResistance',"Live Price":'preMarketContext.livePrice',
-                                "PM Summary":'preMarketContext.tacticalSummary'
-                            }
-                            for name, path in fields_v.items(): st.markdown(f"**{name}:** `{get_v_field(pm_card_v, path)}`")
+                            for name, keys in VIEWER_SCREENER_FIELDS: st.markdown(f"**{name}:** `{get_card_field(pm_card_v, keys)}`")
                         else:
                              st.warning("Cannot extract fields, PM card invalid.")
                     else: st.info("No Pre-Market card generated.")
@@ -1628,7 +2029,7 @@ with tab_screener:
             if not cards_scr: st.warning(f"No cards match filter '{conf_filter_s}'.")
             else:
                 logs_scr = st.expander("Logs", True); logger_scr = AppLogger(logs_scr)
-                key_scr = random.choice(API_KEYS)
+                key_scr = next_api_key()
                 with st.spinner(f"AI ranking {len(cards_scr)} cards with full context..."):
                     # --- CORRECTED FUNCTION CALL ---
                     # Pass the active_economy_card to the screener function
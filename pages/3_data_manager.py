@@ -5,6 +5,7 @@ from datetime import datetime
 import os
 import shutil
 import json
+from database_setup import configure_connection
 
 DATABASE_FILE = "analysis_database.db"
 ETF_LIST = ["SPY", "QQQ", "IWM", "DIA", "GLD", "SLV", "VIX", "USO", "UNG"]
@@ -12,7 +13,7 @@ ETF_LIST = ["SPY", "QQQ", "IWM", "DIA", "GLD", "SLV", "VIX", "USO", "UNG"]
 def get_db_connection():
     """Establishes a connection to the SQLite database."""
     try:
-        return sqlite3.connect(DATABASE_FILE)
+        return configure_connection(sqlite3.connect(DATABASE_FILE))
     except sqlite3.Error as e:
         st.error(f"Database connection error: {e}")
         return None
@@ -197,7 +198,12 @@ with tab_viewer:
         stock_data = get_table_data('stocks')
         if not stock_data.empty:
             tickers = stock_data['ticker'].tolist()
-            selected_tickers = st.multiselect("Select one or more stocks to view:", options=tickers, default=tickers)
+            # Start empty so opening the table doesn't render every card; opt in to the full list
+            show_all = st.toggle("Show all stocks", value=False, key="stocks_show_all")
+            if show_all:
+                selected_tickers = tickers
+            else:
+                selected_tickers = st.multiselect("Select one or more stocks to view:", options=tickers, default=[])
             
             if selected_tickers:
                 st.divider()
@@ -1,72 +1,30 @@
 import streamlit as st
-import yfinance as yf
-import datetime as dt
 import pandas as pd
 import numpy as np
 
-# --- Ticker Grouping ---
-STOCK_TICKERS = [
-    "AAPL", "AMZN", "APP", "ABT", "PEP", "TSLA", "NVDA", "AMD",
-    "SNOW", "NET", "PLTR", "MU", "ORCL", "TSM"
-]
-ETF_TICKERS = [
-    "SPY", "QQQ", "IWM", "DIA", "TLT", "XLK", "XLF", "XLP", "XLE",
-    "SMH", "XLI", "XLV", "UUP", "GLD"
-]
-ALL_TICKERS = sorted(STOCK_TICKERS + ETF_TICKERS)
-
-
-# --- DATA FETCHING ---
-@st.cache_data(ttl=60 * 15)
-def fetch_intraday_data(tickers_list, day, interval="5m"):
-    """Fetches intraday data for a list of tickers for a specific day."""
-    start_time = dt.datetime.combine(day, dt.time(4, 0))
-    end_time = dt.datetime.combine(day, dt.time(20, 0))
-    
-    try:
-        data = yf.download(
-            tickers=tickers_list,
-            start=start_time,
-            end=end_time,
-            interval=interval,
-            group_by='ticker',
-            progress=False
-        )
-        
-        if data.empty:
-            return pd.DataFrame()
+from modules.market_data import STOCK_TICKERS, ETF_TICKERS, ALL_TICKERS, KNOWN_TICKERS, fetch_intraday_data, is_trading_day, previous_trading_day
 
-        if len(tickers_list) > 1:
-            stacked_data = data.stack(level=0).rename_axis(['Datetime', 'Ticker']).reset_index()
-        else:
-            data['Ticker'] = tickers_list[0]
-            stacked_data = data.reset_index()
-
-        stacked_data = stacked_data[['Datetime', 'Ticker', 'Open', 'High', 'Low', 'Close', 'Volume']]
-        stacked_data = stacked_data[stacked_data['Volume'] > 0]
-        
-        return stacked_data
-
-    except Exception as e:
-        st.error(f"Error fetching data: {e}")
-        return pd.DataFrame()
+# A 30-minute opening range needs six 5-minute bars; shorter sessions are skipped
+MIN_SESSION_BARS = 6
 
 # --- ANALYSIS FUNCTIONS ---
-def calculate_vwap(df):
-    """Calculates the Volume Weighted Average Price (VWAP)."""
-    q = df['Volume'] * (df['High'] + df['Low'] + df['Close']) / 3
-    return q.cumsum() / df['Volume'].cumsum()
-
 def calculate_volume_profile(df, bins=30):
     """Calculates POC, VAH, and VAL from a simple volume profile."""
-    price_range = np.linspace(df['Low'].min(), df['High'].max(), bins)
-    volume_at_price = np.zeros(bins)
-    
-    for _, row in df.iterrows():
-        price_indices = np.where((price_range >= row['Low']) & (price_range <= row['High']))
-        if len(price_indices[0]) > 0:
-            volume_at_price[price_indices] += row['Volume'] / len(price_indices[0])
-            
+    if len(df) < 2:
+        return np.nan, np.nan, np.nan
+
+    lows = df['Low'].to_numpy()
+    highs = df['High'].to_numpy()
+    price_range = np.linspace(lows.min(), highs.max(), bins)
+
+    # Each bar spreads its volume evenly over the price levels inside its high-low range.
+    # Rows of the (bar x level) mask are summed in bar order, matching a per-bar accumulation.
+    in_range = (price_range >= lows[:, None]) & (price_range <= highs[:, None])
+    levels_hit = in_range.sum(axis=1)
+    volume_per_level = np.divide(df['Volume'].to_numpy(dtype=np.float64), levels_hit,
+                                 out=np.zeros(len(df)), where=levels_hit > 0)
+    volume_at_price = (in_range * volume_per_level[:, None]).sum(axis=0)
+
     poc_index = np.argmax(volume_at_price)
     poc = price_range[poc_index]
     
@@ -97,24 +55,27 @@ def calculate_volume_profile(df, bins=30):
 
 def calculate_opening_range(df, duration_minutes=30):
     """Calculates the opening range and provides a narrative."""
-    market_open_time = dt.time(9, 30)
-    opening_range_end_time = (dt.datetime.combine(dt.date.today(), market_open_time) + dt.timedelta(minutes=duration_minutes)).time()
-    
-    or_df = df[df['Datetime'].dt.time >= market_open_time]
-    or_df = or_df[or_df['Datetime'].dt.time < opening_range_end_time]
-    
-    if or_df.empty:
+    market_open_minute = 9 * 60 + 30
+    opening_range_end_minute = market_open_minute + duration_minutes
+
+    # Bar times as minutes since midnight, extracted once and shared by both windows
+    bar_minutes = (df['Datetime'].dt.hour * 60 + df['Datetime'].dt.minute).to_numpy()
+    highs = df['High'].to_numpy()
+    lows = df['Low'].to_numpy()
+
+    in_or = (bar_minutes >= market_open_minute) & (bar_minutes < opening_range_end_minute)
+    if not in_or.any():
         return np.nan, np.nan, "No data in opening range."
         
-    orh = or_df['High'].max()
-    orl = or_df['Low'].min()
+    orh = highs[in_or].max()
+    orl = lows[in_or].min()
     
-    after_or_df = df[df['Datetime'].dt.time >= opening_range_end_time]
-    if after_or_df.empty:
+    after_or = bar_minutes >= opening_range_end_minute
+    if not after_or.any():
         return orh, orl, "Session ended within opening range."
         
-    breakout_up = (after_or_df['High'] > orh).any()
-    breakdown_down = (after_or_df['Low'] < orl).any()
+    breakout_up = (highs[after_or] > orh).any()
+    breakdown_down = (lows[after_or] < orl).any()
     
     if breakout_up and not breakdown_down:
         narrative = "Price broke above the opening range and held."
@@ -127,25 +88,30 @@ def calculate_opening_range(df, duration_minutes=30):
         
     return orh, orl, narrative
 
-def find_key_volume_events(df, std_dev_multiplier=2.5):
-    """Identifies bars with unusually high volume."""
-    volume_mean = df['Volume'].mean()
-    volume_std = df['Volume'].std()
+def find_key_volume_events(df, volume_mean, volume_std, std_dev_multiplier=2.5):
+    """Identifies bars with unusually high volume, given the session's volume mean and std."""
     volume_threshold = volume_mean + (volume_std * std_dev_multiplier)
     
-    high_volume_df = df[df['Volume'] > volume_threshold]
-    events = []
-    for _, row in high_volume_df.iterrows():
-        time_str = row['Datetime'].strftime('%H:%M')
-        direction = "Up" if row['Close'] > row['Open'] else "Down"
-        events.append(f"{time_str}: High volume on a {direction} bar.")
+    is_event = df['Volume'].to_numpy() > volume_threshold
+    time_strs = df['Datetime'][is_event].dt.strftime('%H:%M')
+    ups = df['Close'].to_numpy()[is_event] > df['Open'].to_numpy()[is_event]
+    events = [
+        f"{time_str}: High volume on a {'Up' if up else 'Down'} bar."
+        for time_str, up in zip(time_strs, ups)
+    ]
     return events if events else ["No significant volume events detected."]
 
 def get_vwap_interaction(df, vwap_series):
     """Determines if VWAP acted as support or resistance."""
-    if (df['Low'] > vwap_series).all():
+    # Plain ndarray comparisons: no index alignment or intermediate boolean Series
+    vwap = np.asarray(vwap_series)
+    lows = df['Low'].to_numpy()
+    highs = df['High'].to_numpy()
+    # The opening bar's VWAP is its own typical price, which sits inside its range, so
+    # checking that bar first settles the usual "Mixed" case without a full-length pass
+    if lows[0] > vwap[0] and (lows > vwap).all():
         return "Support"
-    elif (df['High'] < vwap_series).all():
+    elif highs[0] < vwap[0] and (highs < vwap).all():
         return "Resistance"
     else:
         return "Mixed (acted as both support and resistance)"
@@ -153,37 +119,76 @@ def get_vwap_interaction(df, vwap_series):
 # --- Core Processing Logic ---
 def generate_analysis_text(tickers_to_process, analysis_date):
     """Performs all analysis and returns a single formatted string."""
+    if not is_trading_day(analysis_date):
+        return f"{analysis_date} is not an NYSE trading day (weekend or holiday). No data to process."
+
+    # Unknown symbols would only cost a round-trip to come back empty
+    unknown_tickers = [t for t in tickers_to_process if t.upper() not in KNOWN_TICKERS]
+    if unknown_tickers:
+        st.warning(f"Skipping unknown tickers: {', '.join(unknown_tickers)}")
+        tickers_to_process = [t for t in tickers_to_process if t.upper() in KNOWN_TICKERS]
+        if not tickers_to_process:
+            return "No valid tickers selected."
+
     all_data_df = fetch_intraday_data(tickers_to_process, analysis_date, interval="5m")
 
     if all_data_df.empty:
         return f"No data found for any tickers on {analysis_date}. It may be a weekend or holiday."
 
+    # Running VWAP for every ticker at once over the full frame
+    all_data_df = all_data_df.sort_values(['Ticker', 'Datetime'], kind='stable', ignore_index=True)
+    # float64 volume so the cumulative sum can't wrap the compact uint32 bar volume
+    volume = all_data_df['Volume'].astype(np.float64)
+    typical_price_volume = volume * (all_data_df['High'] + all_data_df['Low'] + all_data_df['Close']) / 3
+    all_data_df['VWAP'] = (typical_price_volume.groupby(all_data_df['Ticker'], observed=True).cumsum()
+                           / volume.groupby(all_data_df['Ticker'], observed=True).cumsum())
+
+    # All per-ticker session stats in a single grouped aggregation, indexed by ticker
+    gb = all_data_df.groupby('Ticker', observed=True, sort=False)
+    session_stats = gb.agg(
+        open=('Open', 'first'),
+        close=('Close', 'last'),
+        high=('High', 'max'),
+        low=('Low', 'min'),
+        vwap=('VWAP', 'last'),
+        volume_mean=('Volume', 'mean'),
+        volume_std=('Volume', 'std'),
+    )
+
+    # Partition into per-ticker frames once instead of a boolean scan + copy per ticker
+    groups = {name: group.reset_index(drop=True) for name, group in gb}
+
     full_analysis_text = []
     errors = []
+    short_tickers = []
 
     for ticker in tickers_to_process:
-        df_ticker = all_data_df[all_data_df['Ticker'] == ticker.upper()].copy()
+        symbol = ticker.upper()
+        df_ticker = groups.get(symbol)
         
-        if df_ticker.empty:
+        if df_ticker is None:
+            continue
+        if len(df_ticker) < MIN_SESSION_BARS:
+            short_tickers.append(f"{ticker} ({len(df_ticker)} bars)")
             continue
-        
-        df_ticker.reset_index(drop=True, inplace=True)
         
         try:
-            open_price = df_ticker['Open'].iloc[0]
-            close_price = df_ticker['Close'].iloc[-1]
-            hod_price = df_ticker['High'].max()
-            lod_price = df_ticker['Low'].min()
+            stats = session_stats.loc[symbol]
+            open_price = stats['open']
+            close_price = stats['close']
+            hod_price = stats['high']
+            lod_price = stats['low']
             
-            vwap_series = calculate_vwap(df_ticker)
-            session_vwap_final = vwap_series.iloc[-1]
+            vwap_series = df_ticker['VWAP']
+            session_vwap_final = stats['vwap']
             poc, vah, val = calculate_volume_profile(df_ticker)
             orh, orl, or_narrative = calculate_opening_range(df_ticker)
-            key_volume_events = find_key_volume_events(df_ticker)
+            key_volume_events = find_key_volume_events(df_ticker, stats['volume_mean'], stats['volume_std'])
             
             close_vs_vwap = "Above" if close_price > session_vwap_final else "Below"
             vwap_interaction = get_vwap_interaction(df_ticker, vwap_series)
 
+            events_block = "\n".join(f"- {event}" for event in key_volume_events)
             ticker_summary = f"""
 Summary: {ticker} | {analysis_date}
 ==================================================
@@ -201,17 +206,20 @@ Summary: {ticker} | {analysis_date}
 - ORH: {orh:.2f}
 
 Key Volume Events:
+{events_block}
+
+Opening Range Narrative: {or_narrative}
+VWAP Interaction: Price closed {close_vs_vwap} VWAP, which acted as {vwap_interaction}.
 """
-            for event in key_volume_events:
-                ticker_summary += f"- {event}\n"
-            ticker_summary += f"\nOpening Range Narrative: {or_narrative}\n"
-            ticker_summary += f"VWAP Interaction: Price closed {close_vs_vwap} VWAP, which acted as {vwap_interaction}."
             
             full_analysis_text.append(ticker_summary.strip())
 
         except Exception as e:
             errors.append(f"An error occurred during analysis for {ticker}: {e}")
 
+    if short_tickers:
+        st.info(f"Skipping tickers with too few bars for analysis: {', '.join(short_tickers)}")
+
     final_text = "\n\n".join(full_analysis_text)
     if errors:
         final_text += "\n\n--- ERRORS ---\n" + "\n".join(errors)
@@ -219,6 +227,44 @@ Key Volume Events:
     return final_text
 
 # --- Streamlit App Layout ---
+@st.fragment
+def render_processor_panel(tickers, key_prefix, noun, noun_plural):
+    """
+    Renders one ticker group's selection and processing controls. As a fragment,
+    widget changes and the process button rerun only this panel, not the whole page.
+    """
+    title_noun = noun[0].upper() + noun[1:]
+    title_plural = noun_plural[0].upper() + noun_plural[1:]
+
+    st.header(f"Process {title_noun} Tickers")
+
+    selected_tickers = st.multiselect(
+        f"Select {noun} tickers to process",
+        options=tickers,
+        default=tickers,
+        key=f"{key_prefix}_multiselect"
+    )
+
+    selected_date = st.date_input(
+        f"Select Date for {title_plural}",
+        previous_trading_day(),
+        key=f"{key_prefix}_date_input"
+    )
+
+    if st.button(f"Process Selected {title_plural}", key=f"{key_prefix}_process_button", use_container_width=True):
+        if not selected_tickers:
+            st.warning(f"Please select at least one {noun} ticker to process.")
+        else:
+            with st.spinner(f"Fetching and processing data for {len(selected_tickers)} {noun_plural}..."):
+                final_text_to_copy = generate_analysis_text(selected_tickers, selected_date)
+
+                if final_text_to_copy:
+                    st.subheader(f"Combined Analysis for AI ({title_plural})")
+                    st.info("Click the copy icon in the top-right of the box below to copy all text.")
+                    st.code(final_text_to_copy, language="text")
+                else:
+                    st.error(f"Processing failed to generate any output for the selected {noun_plural}.")
+
 def run_streamlit_app():
     st.set_page_config(page_title="Intraday Analysis Processor", layout="wide")
     st.title("Intraday Analysis Processor")
@@ -228,66 +274,14 @@ def run_streamlit_app():
 
     # --- Stocks Tab ---
     with stock_tab:
-        st.header("Process Stock Tickers")
-        
-        selected_stocks = st.multiselect(
-            "Select stock tickers to process",
-            options=STOCK_TICKERS,
-            default=STOCK_TICKERS,
-            key="stock_multiselect"
-        )
-
-        selected_date_stocks = st.date_input(
-            "Select Date for Stocks", 
-            dt.date.today() - dt.timedelta(days=1),
-            key="stock_date_input"
-        )
-
-        if st.button("Process Selected Stocks", key="stock_process_button", use_container_width=True):
-            if not selected_stocks:
-                st.warning("Please select at least one stock ticker to process.")
-            else:
-                with st.spinner(f"Fetching and processing data for {len(selected_stocks)} stocks..."):
-                    final_text_to_copy = generate_analysis_text(selected_stocks, selected_date_stocks)
-                    
-                    if final_text_to_copy:
-                        st.subheader("Combined Analysis for AI (Stocks)")
-                        st.info("Click the copy icon in the top-right of the box below to copy all text.")
-                        st.code(final_text_to_copy, language="text")
-                    else:
-                        st.error("Processing failed to generate any output for the selected stocks.")
+        render_processor_panel(STOCK_TICKERS, "stock", "stock", "stocks")
 
     # --- ETFs Tab ---
     with etf_tab:
-        st.header("Process ETF Tickers")
-
-        selected_etfs = st.multiselect(
-            "Select ETF tickers to process",
-            options=ETF_TICKERS,
-            default=ETF_TICKERS,
-            key="etf_multiselect"
-        )
-
-        selected_date_etfs = st.date_input(
-            "Select Date for ETFs", 
-            dt.date.today() - dt.timedelta(days=1),
-            key="etf_date_input"
-        )
-
-        if st.button("Process Selected ETFs", key="etf_process_button", use_container_width=True):
-            if not selected_etfs:
-                st.warning("Please select at least one ETF ticker to process.")
-            else:
-                with st.spinner(f"Fetching and processing data for {len(selected_etfs)} ETFs..."):
-                    final_text_to_copy = generate_analysis_text(selected_etfs, selected_date_etfs)
-                    
-                    if final_text_to_copy:
-                        st.subheader("Combined Analysis for AI (ETFs)")
-                        st.info("Click the copy icon in the top-right of the box below to copy all text.")
-                        st.code(final_text_to_copy, language="text")
-                    else:
-                        st.error("Processing failed to generate any output for the selected ETFs.")
+        render_processor_panel(ETF_TICKERS, "etf", "ETF", "ETFs")
 
 # --- Main Execution Logic ---
-# This makes the file a runnable Streamlit page.
-run_streamlit_app()
\ No newline at end of file
+# This makes the file a runnable Streamlit page. Streamlit runs pages as __main__, so the
+# guard keeps the processor UI from rendering when another page imports this module.
+if __name__ == "__main__":
+    run_streamlit_app()
\ No newline at end of file
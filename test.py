@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import pandas as pd
+import numpy as np
 import sqlite3
 import json
 import os
@@ -163,7 +164,8 @@ if run_test_button:
         cst, xst = create_session(api_key, identifier, password, logger)
 
     if cst and xst:
-        results = []
+        # Collect results column-wise and build the frame once at the end
+        tickers, statuses, proximities, live_prices, supports, resistances = [], [], [], [], [], []
         processed_count = 0
         kept_count = 0
         
@@ -189,14 +191,21 @@ if run_test_button:
                 if status == "KEEP":
                     kept_count += 1
                 
-                results.append({
-                    "Ticker": ticker,
-                    "Status": status,
-                    "Proximity (%)": f"{proximity_pct:.2f}",
-                    "Live Price": f"${live_price:.2f}",
-                    "Support": f"${support:.2f}",
-                    "Resistance": f"${resistance:.2f}",
-                })
+                tickers.append(ticker)
+                statuses.append(status)
+                proximities.append(proximity_pct)
+                live_prices.append(live_price)
+                supports.append(support)
+                resistances.append(resistance)
+
+        results = pd.DataFrame({
+            "Ticker": tickers,
+            "Status": statuses,
+            "Proximity (%)": np.asarray(proximities, dtype=np.float64),
+            "Live Price": np.asarray(live_prices, dtype=np.float64),
+            "Support": np.asarray(supports, dtype=np.float64),
+            "Resistance": np.asarray(resistances, dtype=np.float64),
+        })
         
         # Store results in session state to persist them
         st.session_state['test_results'] = results
@@ -216,10 +225,19 @@ if 'test_results' in st.session_state:
     kept_count = st.session_state['kept_count']
     threshold = st.session_state['threshold']
 
-    if results:
+    if not results.empty:
         st.success(f"**Test Complete.** Processed {processed_count} tickers with live prices. Found **{kept_count}** stocks matching the **{threshold}%** proximity filter.")
-        df_results = pd.DataFrame(results).sort_values(by="Proximity (%)").reset_index(drop=True)
-        st.dataframe(df_results, use_container_width=True)
+        df_results = results.sort_values(by="Proximity (%)").reset_index(drop=True)
+        st.dataframe(
+            df_results,
+            use_container_width=True,
+            column_config={
+                "Proximity (%)": st.column_config.NumberColumn(format="%.2f"),
+                "Live Price": st.column_config.NumberColumn(format="$%.2f"),
+                "Support": st.column_config.NumberColumn(format="$%.2f"),
+                "Resistance": st.column_config.NumberColumn(format="$%.2f"),
+            }
+        )
     else:
         st.warning(f"**Test Complete.** Processed {processed_count} tickers, but **none** passed the **{threshold}%** proximity filter. Try increasing the threshold.")
     